@@ -0,0 +1,181 @@
+import hashlib
+import json
+from datetime import datetime
+from flask import Blueprint, Response, abort, jsonify, request
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import load_only, selectinload
+from models import db, Venue, Artist, Show
+from listings import encode_cursor, decode_cursor, parse_cursor, is_id
+from counters import as_utc
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+#----------------------------------------------------------------------------#
+# JSON API.
+#
+#   GET /api/v1/venues?fields=id,name&per_page=100&cursor=<next_cursor>
+#   GET /api/v1/venues/<id>?fields=...
+#   GET /api/v1/artists, /api/v1/artists/<id>
+#   GET /api/v1/shows?venue_id=<id>&artist_id=<id>
+#
+# `fields` picks the columns loaded (load_only). Lists are keyset-paginated:
+# each page carries the `next_cursor` to ask for the next one. Every
+# response has an ETag built from the rows' version_id; a client sending it
+# back in If-None-Match gets a 304 without the rows being serialized.
+# Responses are encoded with orjson when it is installed.
+#----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+# model -> its fields, in output order
+FIELDS = {
+    Venue: ('id', 'name', 'city', 'state', 'address', 'phone', 'genres', 'image_link', 'facebook_link',
+            'website', 'seeking_talent', 'seeking_description', 'upcoming_shows_count', 'past_shows_count'),
+    Artist: ('id', 'name', 'city', 'state', 'phone', 'genres', 'image_link', 'facebook_link',
+             'website', 'seeking_venue', 'seeking_description', 'upcoming_shows_count', 'past_shows_count'),
+    Show: ('venue_id', 'artist_id', 'start_time', 'end_time'),
+}
+
+# The show counters change without bumping version_id (see counters.py), so
+# they go into the ETags themselves.
+COUNTERS = ('upcoming_shows_count', 'past_shows_count')
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), default=datetime.isoformat).encode('utf-8')
+
+def requested_fields(model):
+    names = request.args.get('fields')
+    if not names:
+        return FIELDS[model]
+    wanted = {name.strip() for name in names.split(',') if name.strip()}
+    unknown = wanted.difference(FIELDS[model])
+    if unknown:
+        abort(400, 'Unknown fields: {}.'.format(', '.join(sorted(unknown))))
+    return tuple(name for name in FIELDS[model] if name in wanted)
+
+def version_keys(model):
+    # What the ETags are built from, loaded whatever the fields.
+    keys = [column.key for column in inspect(model).primary_key] + ['version_id']
+    return tuple(keys + [name for name in COUNTERS if hasattr(model, name)])
+
+VERSION_KEYS = {model: version_keys(model) for model in FIELDS}
+
+def rows_query(model, fields):
+    names = [name for name in fields if name != 'genres'] + list(VERSION_KEYS[model])
+    options = [load_only(*(getattr(model, name) for name in names), raiseload=True)]
+    if 'genres' in fields:
+        options.append(selectinload(model.genres))
+    return select(model).options(*options)
+
+def version(obj):
+    return tuple(getattr(obj, name) for name in VERSION_KEYS[type(obj)])
+
+def serialize(obj, fields):
+    data = {}
+    for name in fields:
+        value = getattr(obj, name)
+        if name == 'genres':
+            value = [genre.name for genre in value]
+        elif isinstance(value, datetime):
+            value = as_utc(value)
+        data[name] = value
+    return data
+
+def respond(rows, build):
+    """ A 304 if the client has the current version of `rows`, else the
+    JSON of `build()`. The ETag covers the query string as well, which
+    picks the fields and the page. """
+    etag = hashlib.blake2b(
+        repr((request.full_path, [version(row) for row in rows])).encode('utf-8'), digest_size=16
+    ).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(dumps(build()), mimetype='application/json')
+    response.set_etag(etag)
+    # Clients may keep responses but must revalidate them.
+    response.cache_control.no_cache = True
+    return response
+
+def per_page():
+    return min(max(request.args.get('per_page', PER_PAGE, type=int), 1), MAX_PER_PAGE)
+
+def page(query, fields, cursor_of):
+    # One extra row tells whether there is a next page.
+    limit = per_page()
+    rows = db.session.scalars(query.limit(limit + 1)).all()
+    next_cursor = cursor_of(rows[limit - 1]) if len(rows) > limit else None
+    rows = rows[:limit]
+    return respond(rows, lambda: {'data': [serialize(row, fields) for row in rows], 'next_cursor': next_cursor})
+
+def owners(model):
+    fields = requested_fields(model)
+    query = rows_query(model, fields).order_by(model.id)
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            after, = decode_cursor(cursor, size=1)
+        except ValueError:
+            abort(400, 'Invalid cursor.')
+        if not is_id(after):
+            abort(400, 'Invalid cursor.')
+        query = query.where(model.id > after)
+    return page(query, fields, lambda last: encode_cursor(last.id))
+
+def owner(model, id):
+    fields = requested_fields(model)
+    obj = db.session.scalars(rows_query(model, fields).where(model.id == id)).first()
+    if obj is None:
+        abort(404)
+    return respond([obj], lambda: {'data': serialize(obj, fields)})
+
+@api.route('/venues')
+def venues():
+    return owners(Venue)
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    return owner(Venue, venue_id)
+
+@api.route('/artists')
+def artists():
+    return owners(Artist)
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    return owner(Artist, artist_id)
+
+@api.route('/shows')
+def shows():
+    # In start order, as /shows; the venue_id and artist_id filters are
+    # served by the (venue_id|artist_id, start_time) indexes.
+    fields = requested_fields(Show)
+    key = (Show.start_time, Show.venue_id, Show.artist_id)
+    query = rows_query(Show, fields).order_by(*key)
+    for name in ('venue_id', 'artist_id'):
+        if name in request.args:
+            id = request.args.get(name, type=int)
+            if id is None:
+                abort(400, 'Invalid {}.'.format(name))
+            query = query.where(getattr(Show, name) == id)
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            after = parse_cursor(cursor)
+        except ValueError:
+            abort(400, 'Invalid cursor.')
+        query = query.where(db.tuple_(*key) > db.tuple_(*after))
+    return page(query, fields, lambda last: encode_cursor(last.start_time, last.venue_id, last.artist_id))
+
+# By status code: the app's own 404 page would otherwise take precedence.
+@api.errorhandler(400)
+@api.errorhandler(404)
+def error(e):
+    return jsonify(error=e.description), e.code
@@ -5,161 +5,162 @@
 # import datetime
 from datetime import datetime
 import json
-import dateutil.parser
-import babel
+import csv
+import io
+import os
 import sys
 import re
+import logging
+from logging import FileHandler
 from flask import (
+  Blueprint,
   Flask,
+  current_app,
   render_template,
   request,
   Response,
   flash,
   redirect,
-  url_for
+  url_for,
+  abort,
+  jsonify,
+  stream_with_context
 )
-from flask_moment import Moment
-from flask_migrate import Migrate
-from forms import *
-from models import db, Venue, Artist, Show
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import selectinload
+from forms import VenueForm, ArtistForm, ShowForm, start_time_column, end_time_column
+from models import db, Venue, Artist, Show, Genre, venue_genre, artist_genre
+from cache import PageCache, query_key
+from fragments import FragmentCache
+from assets import Assets
+from listings import (
+  SHOWS_PER_PAGE, SHOWS_MAX_PER_PAGE, parse_cursor, shows_query, shows_page,
+  facet_query, group_facets, venues_query, artists_query, group_areas,
+  details, detail_shows_query, split_shows, add_shows
+)
+from pool_metrics import PoolMetrics
+from autocomplete import Autocomplete, MODELS as AUTOCOMPLETE_MODELS
+from profiling import RequestProfiler, JsonFormatter
+from filters import format_datetime
+from commands import LazyCommand, migrate_command
+from counters import counters_command, as_utc, utc_isoformat
+from clock import Clock
+from deletes import delete_owners
+from api import api
+import scheduling
+import search
+import template_cache
 #----------------------------------------------------------------------------#
-# App Config.
+# Extensions, bound to the app by create_app() below.
 #----------------------------------------------------------------------------#
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db.init_app(app)
 
-# TODO: connect to a local postgresql database
-migrate = Migrate(app, db)
+main = Blueprint('main', __name__)
+pool_metrics = PoolMetrics()
+profiler = RequestProfiler()
+autocomplete = Autocomplete()
+clock = Clock()
 
 #----------------------------------------------------------------------------#
-# Get current date.
-current_date = babel.dates.format_datetime(datetime.now(), "medium", locale='en')
+# Page cache.
+#----------------------------------------------------------------------------#
+
+page_cache = PageCache()
+fragment_cache = FragmentCache()
+assets = Assets()
+
+def venue_page_keys(venue_id):
+  # The venue's page and the pages of artists that show the venue's name.
+  # Collect them before the change, evict after commit; the filtered
+  # /venues listings are dropped as the 'venues' namespace.
+  artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+  return ['venue:{}'.format(venue_id)] + ['artist:{}'.format(id) for id, in artist_ids]
+
+def artist_page_keys(artist_id):
+  venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+  return ['artist:{}'.format(artist_id)] + ['venue:{}'.format(id) for id, in venue_ids]
 
 #----------------------------------------------------------------------------#
-# Filters.
+# Genres and facets.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+def genres_by_name(names):
+  # Genre rows for the enums.Genre names submitted by the forms.
+  return Genre.query.filter(Genre.name.in_(names)).order_by(Genre.id).all() if names else []
 
-app.jinja_env.filters['datetime'] = format_datetime
+def facet_counts(model, association, fk, genre=None, state=None):
+  return group_facets(db.session.execute(facet_query(model, association, fk, genre, state)))
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@main.route('/')
 def index():
   return render_template('pages/home.html')
 
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@main.route('/venues')
+@page_cache.cached(query_key('genre', 'state'), namespace='venues')
 def venues():
-  # TODO: replace with real venues data.
-  # num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-  data_list = Venue.query.all()
-  categories = []
-  for item in data_list:
-    venue = {
-      'id': item.id,
-      'name': item.name,
-    }
-    findCurrent = next((c for c in categories if c['city'] == item.city and c['state'] == item.state), None)
-    if findCurrent:
-      findCurrent['venues'].append(venue)
-    else:
-      city = {
-        'city': item.city,
-        'state': item.state,
-        'venues': [venue]
-      }
-      categories.append(city)
-
-  return render_template('pages/venues.html', areas=categories)
-
-@app.route('/venues/search', methods=['POST'])
+  # Venues grouped by city/state, each with its number of upcoming shows,
+  # optionally filtered with ?genre=&state=.
+  # The counts are read from the venue's counter column (see counters.py).
+  genre = request.args.get('genre')
+  state = request.args.get('state')
+  rows = db.session.execute(venues_query(genre, state)).all()
+  facets = facet_counts(Venue, venue_genre, venue_genre.c.venue_id, genre, state)
+  return render_template('pages/venues.html', areas=group_areas(rows), facets=facets,
+                         genre=genre, state=state)
+
+@main.route('/venues/search', methods=['POST'])
 def search_venues():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
 
   search_term = request.form.get('search_term', '')
-  venue_list = Venue.query.filter(Venue.name.ilike('%' + search_term + '%')).all()
+  venue_list = search.search(Venue, search_term)
 
   response = {
     "count": len(venue_list),
-    "data": [],
-    "num_upcoming_shows": 0
-  }
-
-  for venue in venue_list:
-    response["data"].append({
+    "data": [{
       'id': venue.id,
-      'name': venue.name
-    })
+      'name': venue.name,
+      'num_upcoming_shows': venue.num_upcoming_shows
+    } for venue in venue_list]
+  }
 
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
-@app.route('/venues/<int:venue_id>')
+@main.route('/venues/<int:venue_id>')
+@page_cache.cached(lambda venue_id: 'venue:{}'.format(venue_id))
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
-  past_shows = []
-  upcoming_shows = []
-  venue = Venue.query.get_or_404(venue_id)
-  data={
-    "id": venue.id,
-    "name": venue.name,
-    "genres": venue.genres,
-    "address": venue.address,
-    "city": venue.city,
-    "state": venue.state,
-    "phone": venue.phone,
-    "website": venue.website,
-    "facebook_link": venue.facebook_link,
-    "seeking_talent": venue.seeking_talent,
-    "seeking_description": venue.seeking_description,
-    "image_link": venue.image_link
-  }
-  for show in venue.shows:
-    temp_show = {
-        'artist_id': show.artist_id,
-        'artist_name': Artist.query.get_or_404(show.artist_id).name,
-        'artist_image_link': Artist.query.get_or_404(show.artist_id).image_link,
-        'start_time': dateutil.parser.parse(show.start_time).strftime("%m/%d/%Y, %H:%M")
-    }
-    if show.start_time <= current_date:
-        past_shows.append(temp_show)
-    else:
-        upcoming_shows.append(temp_show)
-
-  # object class to dict
-  data = vars(venue)
-
-  data['past_shows'] = past_shows
-  data['upcoming_shows'] = upcoming_shows
-  data['past_shows_count'] = len(past_shows)
-  data['upcoming_shows_count'] = len(upcoming_shows)
+  venue = Venue.query.options(selectinload(Venue.genres)).filter_by(id=venue_id).first_or_404()
+
+  # All shows of the venue in one joined query, in start order, with the
+  # artist's name and image attached, split at this request's time.
+  now = clock.now()
+  rows = db.session.execute(detail_shows_query(Venue, venue_id, now)).all()
+  past_shows, upcoming_shows = split_shows(rows, now)
+  if upcoming_shows:
+    # The cached page turns stale when the next show starts.
+    page_cache.expires_at(as_utc(upcoming_shows[0].start_time))
+  data = add_shows(details(venue), Venue, past_shows, upcoming_shows)
   return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@main.route('/venues/create', methods=['GET'])
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   # TODO: insert form data as a new Venue record in the db, instead
   # Set the FlaskForm
@@ -170,16 +171,12 @@ def create_venue_submission():
     try:
       data = Venue(
         name = form.name.data, city = form.city.data, state = form.state.data, address = form.address.data,
-        phone = form.phone.data, genres = '', image_link = form.image_link.data, facebook_link = form.facebook_link.data,
+        phone = form.phone.data, genres = genres_by_name(form.genres.data), image_link = form.image_link.data, facebook_link = form.facebook_link.data,
         website = form.website_link.data, seeking_description = form.seeking_description.data, seeking_talent = form.seeking_talent.data
       )
-      for item in enumerate(form.genres.data):
-        if item[0] != (len(form.genres.data) - 1):
-          data.genres += item[1] + ', '
-        else:
-          data.genres += item[1]
       db.session.add(data)
       db.session.commit()
+      page_cache.evict_namespace('venues')
     except ValueError as e:
       print(e)
       db.session.rollback()
@@ -201,115 +198,115 @@ def create_venue_submission():
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/<int:venue_id>/delete', methods=['DELETE','POST','GET'])
+@main.route('/venues/<int:venue_id>/delete', methods=['POST', 'DELETE'])
 def delete_venue(venue_id):
-  print("venue_id", venue_id)
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-  try:
-      data_delete_id = venue_id
-      venue = Venue.query.get(venue_id)
-      db.session.delete(venue)
-      db.session.query(Show).filter_by(venue_id = data_delete_id).delete()
-      db.session.commit()
-      flash('Venue ' + str(venue_id) + ' was successfully removed!')
-  except():
-    print(sys.exc_info())
-    db.session.rollback()
-  finally:
-      db.session.close()
+  return delete_one(Venue, venue_id, url_for('main.show_venue', venue_id=venue_id))
 
-  # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
-  # clicking that button delete it from the db then redirect the user to the homepage
-  return redirect('/')
+@main.route('/venues/delete', methods=['POST'])
+def delete_venues():
+  return delete_many(Venue)
+
+def delete_one(model, id, back):
+  # The shows go with it through ON DELETE CASCADE (see deletes.py).
+  try:
+    deleted = delete_owners(model, [id])
+  except SQLAlchemyError:
+    current_app.logger.exception('Deleting %s %s failed', model.__name__, id)
+    flash('An error occurred. {} {} could not be deleted.'.format(model.__name__, id))
+    return redirect(back)
+  if not deleted:
+    abort(404)
+  flash('{} {} was successfully deleted!'.format(model.__name__, id))
+  return redirect(url_for('main.index'))
+
+def delete_many(model):
+  # Batch deletes: form ids=1&ids=2 or JSON {"ids": [1, 2]}; answers with
+  # the ids that existed.
+  if request.is_json:
+    payload = request.get_json(silent=True)
+    ids = payload.get('ids') if isinstance(payload, dict) else None
+  else:
+    ids = request.form.getlist('ids')
+  if not isinstance(ids, list):
+    abort(400)
+  try:
+    ids = [int(id) for id in ids]
+  except (TypeError, ValueError):
+    abort(400)
+  return jsonify(deleted=delete_owners(model, ids))
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@main.route('/artists')
+@page_cache.cached(query_key('genre', 'state'), namespace='artists')
 def artists():
   # TODO: replace with real data returned from querying the database
-  data_list = Artist.query.order_by(db.asc(Artist.id)).all()
-  data = []
-  for item in data_list:
-    data.append({
-      'id': item.id,
-      'name': item.name
-    })
-  return render_template('pages/artists.html', artists=data)
-
-@app.route('/artists/search', methods=['POST'])
+  # Optionally filtered with ?genre=&state=.
+  genre = request.args.get('genre')
+  state = request.args.get('state')
+  data = [{
+    'id': row.id,
+    'name': row.name
+  } for row in db.session.execute(artists_query(genre, state))]
+  facets = facet_counts(Artist, artist_genre, artist_genre.c.artist_id, genre, state)
+  return render_template('pages/artists.html', artists=data, facets=facets, genre=genre, state=state)
+
+@main.route('/artists/search', methods=['POST'])
 def search_artists():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
 
   search_term = request.form.get('search_term', '')
-  artist_list = Artist.query.filter(Artist.name.ilike('%' + search_term + '%')).all()
+  artist_list = search.search(Artist, search_term)
 
   response = {
     "count": len(artist_list),
-    "data": [],
-    "num_upcoming_shows": 0
+    "data": [{
+      'id': artist.id,
+      'name': artist.name,
+      'num_upcoming_shows': artist.num_upcoming_shows
+    } for artist in artist_list]
   }
 
-  for artist in artist_list:
-    response["data"].append({
-      'id': artist.id,
-      'name': artist.name
-    })
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
-@app.route('/artists/<int:artist_id>')
+@main.route('/artists/<int:artist_id>')
+@page_cache.cached(lambda artist_id: 'artist:{}'.format(artist_id))
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
   # TODO: replace with real artist data from the artist table, using artist_id
-  past_shows = []
-  upcoming_shows = []
-  artist = Artist.query.get_or_404(artist_id)
-  data={
-    "id": artist.id,
-    "name": artist.name,
-    "genres": artist.genres,
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "website": artist.website,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_venue,
-    "seeking_description": artist.seeking_description,
-    "image_link": artist.image_link
-  }
-  for show in artist.shows:
-    temp_show = {
-        'venue_id': show.venue_id,
-        'venue_name': Venue.query.get_or_404(show.venue_id).name,
-        'venue_image_link': Venue.query.get_or_404(show.venue_id).image_link,
-        'start_time': dateutil.parser.parse(show.start_time).strftime("%m/%d/%Y, %H:%M")
-    }
-    if show.start_time <= current_date:
-        past_shows.append(temp_show)
-    else:
-        upcoming_shows.append(temp_show)
-
-  # object class to dict
-  data = vars(artist)
-
-  data['past_shows'] = past_shows
-  data['upcoming_shows'] = upcoming_shows
-  data['past_shows_count'] = len(past_shows)
-  data['upcoming_shows_count'] = len(upcoming_shows)
+  artist = Artist.query.options(selectinload(Artist.genres)).filter_by(id=artist_id).first_or_404()
+
+  # All shows of the artist in one joined query, in start order, with the
+  # venue's name and image attached, split at this request's time.
+  now = clock.now()
+  rows = db.session.execute(detail_shows_query(Artist, artist_id, now)).all()
+  past_shows, upcoming_shows = split_shows(rows, now)
+  if upcoming_shows:
+    # The cached page turns stale when the next show starts.
+    page_cache.expires_at(as_utc(upcoming_shows[0].start_time))
+  data = add_shows(details(artist), Artist, past_shows, upcoming_shows)
   return render_template('pages/show_artist.html', artist=data)
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@main.route('/artists/<int:artist_id>/delete', methods=['POST', 'DELETE'])
+def delete_artist(artist_id):
+  return delete_one(Artist, artist_id, url_for('main.show_artist', artist_id=artist_id))
+
+@main.route('/artists/delete', methods=['POST'])
+def delete_artists():
+  return delete_many(Artist)
+
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   form = ArtistForm()
-  edit_artist = Artist.query.filter_by(id = artist_id).all()[0]
+  edit_artist = Artist.query.options(selectinload(Artist.genres)).filter_by(id = artist_id).first_or_404()
   artist={
     "id": edit_artist.id,
     "name": edit_artist.name,
-    "genres": edit_artist.genres.split(", "),
+    "genres": [genre.name for genre in edit_artist.genres],
     "city": edit_artist.city,
     "state": edit_artist.state,
     "phone": edit_artist.phone,
@@ -329,15 +326,16 @@ def edit_artist(artist_id):
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
   try:
     submit_form = ArtistForm(request.form)
+    stale_pages = artist_page_keys(artist_id)
     edit_data = Artist.query.get(artist_id)
     edit_data.name = submit_form.name.data
-    edit_data.genres = str(", ").join(submit_form.genres.data)
+    edit_data.genres = genres_by_name(submit_form.genres.data)
     edit_data.city = submit_form.city.data
     edit_data.state = submit_form.state.data
     edit_data.phone = submit_form.phone.data
@@ -347,21 +345,24 @@ def edit_artist_submission(artist_id):
     edit_data.seeking_description = submit_form.seeking_description.data
     edit_data.image_link = submit_form.image_link.data
     db.session.commit()
+    page_cache.evict(*stale_pages)
+    page_cache.evict_namespace('artists')
+    page_cache.evict_namespace('shows')
   except:
     db.session.rollback()
     print(sys.exc_info())
   finally:
     db.session.close()
-  return redirect(url_for('show_artist', artist_id=artist_id))
+  return redirect(url_for('main.show_artist', artist_id=artist_id))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   form = VenueForm()
-  edit_venue = Venue.query.filter_by(id = venue_id).all()[0]
+  edit_venue = Venue.query.options(selectinload(Venue.genres)).filter_by(id = venue_id).first_or_404()
   venue={
     "id": edit_venue.id,
     "name": edit_venue.name,
-    "genres": edit_venue.genres.split(", "),
+    "genres": [genre.name for genre in edit_venue.genres],
     "address": edit_venue.address,
     "city": edit_venue.city,
     "state": edit_venue.state,
@@ -381,15 +382,16 @@ def edit_venue(venue_id):
   )
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
   try:
     submit_form = VenueForm(request.form)
+    stale_pages = venue_page_keys(venue_id)
     edit_data = Venue.query.get(venue_id)
     edit_data.name = submit_form.name.data
-    edit_data.genres = str(", ").join(submit_form.genres.data)
+    edit_data.genres = genres_by_name(submit_form.genres.data)
     edit_data.address = submit_form.address.data
     edit_data.city = submit_form.city.data
     edit_data.state = submit_form.state.data
@@ -400,22 +402,25 @@ def edit_venue_submission(venue_id):
     edit_data.seeking_description = submit_form.seeking_description.data
     edit_data.image_link = submit_form.image_link.data
     db.session.commit()
+    page_cache.evict(*stale_pages)
+    page_cache.evict_namespace('venues')
+    page_cache.evict_namespace('shows')
   except:
     db.session.rollback()
     print(sys.exc_info())
   finally:
     db.session.close()
-  return redirect(url_for('show_venue', venue_id=venue_id))
+  return redirect(url_for('main.show_venue', venue_id=venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # TODO: insert form data as a new Artist record in the db, instead
   # Set the FlaskForm
@@ -425,17 +430,14 @@ def create_artist_submission():
     # Prepare for transaction
     try:
       data = Artist(
-        name = form.name.data, city = form.city.data, state = form.state.data, phone = form.phone.data, genres = '',
+        name = form.name.data, city = form.city.data, state = form.state.data, phone = form.phone.data,
+        genres = genres_by_name(form.genres.data),
         image_link = form.image_link.data, facebook_link = form.facebook_link.data, website = form.website_link.data,
         seeking_description = form.seeking_description.data, seeking_venue = form.seeking_venue.data
       )
-      for item in enumerate(form.genres.data):
-        if item[0] != (len(form.genres.data) - 1):
-          data.genres += item[1] + ', '
-        else:
-          data.genres += item[1]
       db.session.add(data)
       db.session.commit()
+      page_cache.evict_namespace('artists')
     except ValueError as e:
       print(e)
       db.session.rollback()
@@ -460,46 +462,72 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@main.route('/shows')
+@page_cache.cached(query_key('cursor', 'per_page'), namespace='shows')
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  shows_list = Show.query.all()
-  # Process the shows_list and construct the data
-  data = []
-  for show in shows_list:
-    venue = Venue.query.get_or_404(show.venue_id)
-    artist = Artist.query.get_or_404(show.artist_id)
-    data.append({
-      "venue_id": show.venue_id,
-      "venue_name": venue.name if venue else None,
-      "artist_id": show.artist_id,
-      "artist_name": artist.name if artist else None,
-      "artist_image_link": artist.image_link if artist else None,
-      "start_time": show.start_time
-    }) 
-  return render_template('pages/shows.html', shows=data)
-
-@app.route('/shows/create')
+  # displays list of shows at /shows, one page at a time.
+  per_page = min(max(request.args.get('per_page', SHOWS_PER_PAGE, type=int), 1), SHOWS_MAX_PER_PAGE)
+  cursor = request.args.get('cursor')
+  try:
+    after = parse_cursor(cursor) if cursor else None
+  except ValueError:
+    abort(400)
+  rows = db.session.execute(shows_query(after, per_page)).all()
+  data, next_cursor = shows_page(rows, per_page)
+  return render_template('pages/shows.html', shows=data, per_page=per_page,
+                         cursor=cursor, next_cursor=next_cursor)
+
+@main.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # TODO: insert form data as a new Show record in the db, instead
   # Set the FlaskForm
   form = ShowForm(request.form, meta={'csrf': False})
   # Validate all fields
   if form.validate():
+    # Unknown ids would fail the foreign keys; say which one instead.
+    unknown = False
+    for field, model, name in ((form.artist_id, Artist, 'artist'), (form.venue_id, Venue, 'venue')):
+      if not field.data.isdigit() or db.session.get(model, int(field.data)) is None:
+        field.errors.append('Unknown id.')
+        flash('There is no {} with ID {}.'.format(name, field.data))
+        unknown = True
+    if unknown:
+      return render_template('forms/new_show.html', form=form)
+    start_time = start_time_column(form)
+    end_time = end_time_column(form)
+    # Refuse double bookings of the venue or the artist up front, with a
+    # message saying which show is in the way.
+    conflict = scheduling.find_conflict(form.venue_id.data, form.artist_id.data, start_time, end_time)
+    if conflict is not None:
+      flash(scheduling.conflict_message(conflict, form.venue_id.data))
+      return render_template('forms/new_show.html', form=form)
     # Prepare for transaction
     try:
       data = Show(
-        artist_id = form.artist_id.data, venue_id = form.venue_id.data, start_time = form.start_time.data
+        artist_id = form.artist_id.data, venue_id = form.venue_id.data, start_time = start_time,
+        end_time = end_time
       )
       db.session.add(data)
       db.session.commit()
+      page_cache.evict('venue:{}'.format(form.venue_id.data), 'artist:{}'.format(form.artist_id.data))
+      page_cache.evict_namespace('venues')
+      page_cache.evict_namespace('shows')
+    except IntegrityError as e:
+      db.session.rollback()
+      if scheduling.is_double_booking(e):
+        # Booked concurrently since the check (the exclusion constraints on
+        # PostgreSQL), or the same show listed twice.
+        flash('The venue or the artist is already booked at this time.')
+      else:
+        # The venue or the artist was deleted since the check.
+        flash('The venue or the artist no longer exists.')
+      return render_template('forms/new_show.html', form=form)
     except ValueError as e:
       print(e)
       db.session.rollback()
@@ -521,24 +549,183 @@ def create_show_submission():
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
+#  Export
+#  ----------------------------------------------------------------
+
+def genre_labels(association, fk):
+  # One comma-joined genre string per venue/artist, aggregated once for the
+  # whole export rather than per row.
+  return db.select(
+    fk.label('id'), db.func.aggregate_strings(Genre.label, ', ').label('genres')
+  ).join(Genre, Genre.id == association.c.genre_id).group_by(fk).subquery()
+
+venue_genres = genre_labels(venue_genre, venue_genre.c.venue_id)
+artist_genres = genre_labels(artist_genre, artist_genre.c.artist_id)
+
+EXPORT_COLUMNS = [
+  ('start_time', Show.start_time),
+  ('venue_id', Show.venue_id),
+  ('venue_name', Venue.name),
+  ('venue_address', Venue.address),
+  ('venue_city', Venue.city),
+  ('venue_state', Venue.state),
+  ('venue_phone', Venue.phone),
+  ('venue_website', Venue.website),
+  ('venue_genres', venue_genres.c.genres),
+  ('artist_id', Show.artist_id),
+  ('artist_name', Artist.name),
+  ('artist_city', Artist.city),
+  ('artist_state', Artist.state),
+  ('artist_website', Artist.website),
+  ('artist_genres', artist_genres.c.genres),
+  ('artist_image_link', Artist.image_link),
+]
+EXPORT_BATCH = 1000
+
+def export_filters():
+  # ?start=&end= (ISO 8601, end exclusive), ?venue_id=, ?artist_id=
+  filters = []
+  try:
+    if request.args.get('start'):
+      filters.append(Show.start_time >= as_utc(datetime.fromisoformat(request.args['start'])))
+    if request.args.get('end'):
+      filters.append(Show.start_time < as_utc(datetime.fromisoformat(request.args['end'])))
+    if request.args.get('venue_id'):
+      filters.append(Show.venue_id == int(request.args['venue_id']))
+    if request.args.get('artist_id'):
+      filters.append(Show.artist_id == int(request.args['artist_id']))
+  except ValueError:
+    abort(400)
+  return filters
+
+@main.route('/export/shows.<any(csv, jsonl):format>')
+def export_shows(format):
+  # Full show catalog with venue and artist details, streamed from a
+  # server-side cursor so memory stays flat however many shows there are.
+  query = db.select(*(column.label(name) for name, column in EXPORT_COLUMNS)) \
+    .join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id) \
+    .outerjoin(venue_genres, venue_genres.c.id == Show.venue_id) \
+    .outerjoin(artist_genres, artist_genres.c.id == Show.artist_id) \
+    .where(*export_filters()) \
+    .order_by(Show.start_time, Show.venue_id, Show.artist_id) \
+    .execution_options(yield_per=EXPORT_BATCH)
+  names = [name for name, column in EXPORT_COLUMNS]
+
+  def generate_csv():
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for rows in db.session.execute(query).partitions():
+      writer.writerows((utc_isoformat(row.start_time),) + tuple(row[1:]) for row in rows)
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+    yield buffer.getvalue()
+
+  def generate_jsonl():
+    for rows in db.session.execute(query).partitions():
+      yield ''.join(json.dumps(dict(row._mapping), default=utc_isoformat) + '\n' for row in rows)
+
+  generate, mimetype = {
+    'csv': (generate_csv, 'text/csv'),
+    'jsonl': (generate_jsonl, 'application/x-ndjson'),
+  }[format]
+  return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+    'Content-Disposition': 'attachment; filename=shows.{}'.format(format)
+  })
+
+#  Autocomplete
+#  ----------------------------------------------------------------
+
+@main.route('/api/autocomplete')
+def autocomplete_names():
+  # Typeahead for venue and artist names: ?type=venue|artist&q=<prefix>
+  model = AUTOCOMPLETE_MODELS.get(request.args.get('type'))
+  if model is None:
+    abort(400)
+  limit = min(max(request.args.get('limit', current_app.config['AUTOCOMPLETE_LIMIT'], type=int), 1),
+              current_app.config['AUTOCOMPLETE_MAX_LIMIT'])
+  matches = autocomplete.lookup(model, request.args.get('q', ''), limit)
+  return jsonify(results=[{'id': id, 'name': name} for id, name in matches])
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+@main.route('/metrics')
+def metrics():
+  return jsonify(cache=page_cache.stats(), fragments=fragment_cache.stats(), pool=pool_metrics.stats())
+
 # Function to errorhandler
-@app.errorhandler(404)
+@main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+#----------------------------------------------------------------------------#
+# App factory.
+#----------------------------------------------------------------------------#
+
+# One handler per log file: loggers are process-wide, and each app created
+# would otherwise add another handler writing every line again.
+log_handlers = {}
+
+def log_handler(app):
+  path = app.config.get('LOG_FILE')
+  if app.debug or not path:
+    path = None
+  else:
+    path = os.path.join(app.instance_path, path)
+  if path not in log_handlers:
+    handler = None
+    if path is not None:
+      try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = FileHandler(path)
+      except OSError:
+        # Read-only filesystem: log to stderr.
+        pass
+    handler = handler or logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    handler.setLevel(logging.INFO)
+    log_handlers[path] = handler
+  return log_handlers[path]
+
+def create_app(config='config'):
+  app = Flask(__name__)
+  app.config.from_object(config)
+  db.init_app(app)
+  clock.init_app(app)
+  pool_metrics.init_app(db, app)
+  profiler.init_app(db, app)
+  autocomplete.init_app(db, app)
+  page_cache.init_app(app)
+  fragment_cache.init_app(app)
+  app.jinja_env.filters['datetime'] = format_datetime
+  template_cache.init_app(app)
+  assets.init_app(app)
+  app.register_blueprint(main)
+  app.register_blueprint(api)
+  if app.config['ASYNC_PAGES']:
+    # Pulls in asyncio and the async engine; only ASGI deployments need it.
+    import async_pages
+    async_pages.init_app(app)
+
+  app.cli.add_command(migrate_command(app, db))
+  app.cli.add_command(LazyCommand('import', 'importer:import_command',
+                                  help='Bulk-load venues, artists or shows from a CSV or JSON Lines file.'))
+  app.cli.add_command(counters_command)
+
+  # Errors and slow requests are written as JSON lines.
+  handler = log_handler(app)
+  logging.getLogger('fyyur.profile').addHandler(handler)
+  if not app.debug:
+      app.logger.setLevel(logging.INFO)
+      app.logger.addHandler(handler)
+      app.logger.info('errors')
+  return app
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -546,11 +733,11 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
@@ -0,0 +1,35 @@
+""" ASGI entry point, with the async pages enabled:
+
+    uvicorn asgi:app --workers 4
+
+The Flask app is still WSGI: each request runs on a worker thread, while the
+async views (see async_pages.py) run on the server's event loop, so slow
+clients and database waits don't pin a process.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+os.environ.setdefault('ASYNC_PAGES', 'true')
+
+from app import create_app
+
+flask_app = create_app()
+
+# Threads running the WSGI side of requests.
+THREADS = int(os.environ.get('ASGI_THREADS', 32))
+
+class ThreadPoolWsgiToAsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs WSGI apps on its single thread-sensitive thread by default,
+    # which would serialize every request of the process.
+    run_wsgi_app = sync_to_async(
+        WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False,
+        executor=ThreadPoolExecutor(THREADS, thread_name_prefix='wsgi'))
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await ThreadPoolWsgiToAsgiInstance(self.wsgi_application)(scope, receive, send)
+
+flask_app.config['ASYNC_SHARED_LOOP'] = True
+app = ThreadPoolWsgiToAsgi(flask_app)
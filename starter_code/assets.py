@@ -0,0 +1,193 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import click
+from flask import Blueprint, abort, current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+#----------------------------------------------------------------------------#
+# Fingerprinted, precompressed static files.
+#
+#   flask --app app build-assets
+#
+# copies every file under static/ into ASSETS_DIR under a name carrying a
+# hash of its content (css/main.css -> css/main.3f2a9c1b07de.css), writes
+# gzip and, with the brotli package installed, brotli copies of the text
+# files, and records it all in ASSETS_DIR/manifest.json. Templates link
+# files with asset_url('css/main.css'): the hashed URL under /assets when the
+# manifest has the file, the plain /static URL otherwise (no build, or
+# debug mode, where edits show up without rebuilding).
+#
+# A hashed URL never changes content, so /assets responses may be cached
+# for ASSETS_MAX_AGE and are marked immutable; browsers stop revalidating
+# them. Clients get the brotli or gzip copy when their Accept-Encoding
+# allows it. Builds keep the files of earlier ones, which pages served by
+# workers still on the old manifest link to.
+#
+# Config:
+#   ASSETS_DIR       where build-assets writes; manifest.json is read from it
+#   ASSETS_MAX_AGE   Cache-Control max-age of /assets responses, in seconds
+#----------------------------------------------------------------------------#
+
+# Compressed copies are written for these; images and fonts like woff are
+# compressed already.
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.eot', '.ttf', '.otf', '.json', '.txt', '.html')
+# Preferred first.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+SUFFIXES = dict(ENCODINGS)
+
+CSS_URL = re.compile(r'''url\((['"]?)([^'")]+)\1\)''')
+
+class Assets:
+    def __init__(self, app=None):
+        self.manifest = {}
+        # hashed path -> encodings it has copies in
+        self.encodings = {}
+        self.max_age = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get('ASSETS_DIR')
+        self.max_age = app.config.get('ASSETS_MAX_AGE', 365 * 24 * 3600)
+        self.load(None if app.debug else self.directory)
+        app.register_blueprint(self.blueprint())
+        app.jinja_env.globals['asset_url'] = self.url
+        app.cli.add_command(build_command)
+        app.extensions['assets'] = self
+
+    def load(self, directory):
+        path = os.path.join(directory, 'manifest.json') if directory else None
+        if path is None or not os.path.exists(path):
+            self.manifest, self.encodings = {}, {}
+            return
+        with open(path, encoding='utf-8') as f:
+            files = json.load(f)['files']
+        self.manifest = {name: entry['path'] for name, entry in files.items()}
+        self.encodings = {entry['path']: entry['encodings'] for entry in files.values()}
+
+    def url(self, filename):
+        """ URL of a file under static/, hashed once assets are built. """
+        hashed = self.manifest.get(filename)
+        if hashed is None:
+            return url_for('static', filename=filename)
+        return url_for('assets.asset', filename=hashed)
+
+    def blueprint(self):
+        blueprint = Blueprint('assets', __name__, url_prefix='/assets')
+
+        @blueprint.route('/<path:filename>')
+        def asset(filename):
+            if filename not in self.encodings:
+                abort(404)
+            available = self.encodings[filename]
+            encoding = request.accept_encodings.best_match([name for name, _ in ENCODINGS if name in available])
+            response = send_from_directory(
+                self.directory, filename + SUFFIXES[encoding] if encoding else filename,
+                mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                max_age=self.max_age,
+            )
+            if encoding:
+                response.content_encoding = encoding
+            if available:
+                response.vary.add('Accept-Encoding')
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+            return response
+
+        return blueprint
+
+def fingerprint(name, data):
+    digest = hashlib.blake2b(data, digest_size=6).hexdigest()
+    root, ext = posixpath.splitext(name)
+    return '{}.{}{}'.format(root, digest, ext)
+
+def rewrite_css_urls(name, data, manifest):
+    # Relative url()s would resolve to unhashed names under /assets; point
+    # them at the hashed copies.
+    base = posixpath.dirname(name)
+
+    def replace(match):
+        quote, target = match.groups()
+        if re.match(r'[a-z]+:|/|#', target):
+            return match.group(0)
+        path, sep, rest = split_url(target)
+        hashed = manifest.get(posixpath.normpath(posixpath.join(base, path)))
+        if hashed is None:
+            return match.group(0)
+        return 'url({0}{1}{2}{0})'.format(quote, posixpath.relpath(hashed, base or '.'), sep + rest)
+
+    return CSS_URL.sub(replace, data.decode('utf-8')).encode('utf-8')
+
+def split_url(target):
+    # 'font.eot?#iefix' -> ('font.eot', '?', '#iefix')
+    match = re.search(r'[?#]', target)
+    if match is None:
+        return target, '', ''
+    return target[:match.start()], target[match.start()], target[match.end():]
+
+def compressors():
+    yield 'gzip', lambda data: gzip.compress(data, 9, mtime=0)
+    try:
+        import brotli
+    except ImportError:
+        return
+    yield 'br', lambda data: brotli.compress(data, quality=11)
+
+def build(source, target):
+    """ Fingerprint and compress the files under `source` into `target`.
+    Returns the manifest. """
+    names = []
+    for root, _, files in os.walk(source):
+        for filename in files:
+            if not filename.startswith('.'):
+                names.append(os.path.relpath(os.path.join(root, filename), source).replace(os.sep, '/'))
+    # Stylesheets last: their url()s are rewritten to the hashed names of
+    # the files they reference.
+    names.sort(key=lambda name: (name.endswith('.css'), name))
+    hashed_names = {}
+    files = {}
+    encoders = list(compressors())
+    for name in names:
+        with open(os.path.join(source, name), 'rb') as f:
+            data = f.read()
+        if name.endswith('.css'):
+            data = rewrite_css_urls(name, data, hashed_names)
+        hashed = fingerprint(name, data)
+        hashed_names[name] = hashed
+        encodings = []
+        write(target, hashed, data)
+        if name.endswith(COMPRESSIBLE):
+            for encoding, compress in encoders:
+                compressed = compress(data)
+                # Not worth a Content-Encoding for a few bytes.
+                if len(compressed) < len(data) * 0.9:
+                    write(target, hashed + SUFFIXES[encoding], compressed)
+                    encodings.append(encoding)
+        files[name] = {'path': hashed, 'size': len(data), 'encodings': encodings}
+    manifest = {'files': files}
+    write(target, 'manifest.json', json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+def write(directory, name, data):
+    # Written aside and renamed into place, so running workers never read
+    # a partial file.
+    path = os.path.join(directory, *name.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+@click.command('build-assets')
+@with_appcontext
+def build_command():
+    """ Fingerprint and precompress static/ into ASSETS_DIR. """
+    directory = current_app.config.get('ASSETS_DIR')
+    if not directory:
+        raise click.UsageError('ASSETS_DIR is not set.')
+    files = build(current_app.static_folder, directory)['files']
+    compressed = sum(1 for entry in files.values() if entry['encodings'])
+    click.echo('Built {} assets ({} compressed) into {}.'.format(len(files), compressed, directory))
@@ -0,0 +1,167 @@
+import asyncio
+from flask import Blueprint, abort, current_app, request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+from sqlalchemy.pool import NullPool
+from models import db, Venue, Artist, venue_genre, artist_genre
+from listings import (
+    SHOWS_PER_PAGE, SHOWS_MAX_PER_PAGE, parse_cursor, shows_query, shows_page,
+    facet_query, group_facets, venues_query, artists_query, group_areas,
+    details, detail_shows_query, add_shows
+)
+import clock
+import search
+#----------------------------------------------------------------------------#
+# Async read-only pages.
+#
+# The listing, detail, /shows and search pages again under /async, as
+# `async def` views on SQLAlchemy's asyncio extension (asyncpg, or aiosqlite
+# for SQLite). Queries a page needs independently run concurrently on their
+# own connections, and templates are rendered with Jinja's async mode.
+# Enabled with ASYNC_PAGES; the pages are not page-cached, so they always
+# show the cost of the database path.
+#
+# Under a WSGI server Flask runs every async view in a fresh event loop, and
+# connections can't outlive their loop, so the engine doesn't pool. Served
+# through asgi.py the views share the server's loop and the engine pools
+# like the sync one (see engine_options in config.py).
+#----------------------------------------------------------------------------#
+
+async_pages = Blueprint('async_pages', __name__, url_prefix='/async')
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+def async_url(uri):
+    url = make_url(uri)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+def init_app(app):
+    app.register_blueprint(async_pages)
+
+def get_sessionmaker():
+    app = current_app._get_current_object()
+    sessionmaker = app.extensions.get('async_sessionmaker')
+    if sessionmaker is None:
+        url = async_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        # The sync engine's pool settings; asyncpg takes the statement
+        # timeout as a server setting instead of libpq options.
+        options = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+        options.pop('connect_args', None)
+        if not app.config.get('ASYNC_SHARED_LOOP'):
+            options['poolclass'] = NullPool
+            for key in ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle', 'pool_use_lifo'):
+                options.pop(key, None)
+        if url.get_backend_name() == 'postgresql' and app.config.get('DB_STATEMENT_TIMEOUT'):
+            options['connect_args'] = {'server_settings': {
+                'statement_timeout': str(app.config['DB_STATEMENT_TIMEOUT'])}}
+        engine = create_async_engine(url, **options)
+        sessionmaker = app.extensions['async_sessionmaker'] = async_sessionmaker(engine, expire_on_commit=False)
+    return sessionmaker
+
+async def fetch(statement):
+    # One session, hence one connection, per statement so that gathered
+    # statements really run side by side.
+    async with get_sessionmaker()() as session:
+        return (await session.execute(statement)).all()
+
+async def fetch_one(statement):
+    async with get_sessionmaker()() as session:
+        return (await session.scalars(statement)).first()
+
+async def render_template(template_name, **context):
+    app = current_app._get_current_object()
+    env = app.extensions.get('async_jinja_env')
+    if env is None:
+        # Shares the app environment's loader, filters and globals.
+        env = app.extensions['async_jinja_env'] = app.jinja_env.overlay(enable_async=True)
+    app.update_template_context(context)
+    return await env.get_template(template_name).render_async(context)
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@async_pages.route('/venues')
+async def venues():
+    genre = request.args.get('genre')
+    state = request.args.get('state')
+    rows, facets = await asyncio.gather(
+        fetch(venues_query(genre, state)),
+        fetch(facet_query(Venue, venue_genre, venue_genre.c.venue_id, genre, state)),
+    )
+    return await render_template('pages/venues.html', areas=group_areas(rows), facets=group_facets(facets),
+                                 genre=genre, state=state)
+
+@async_pages.route('/venues/<int:venue_id>')
+async def show_venue(venue_id):
+    return await render_template('pages/show_venue.html', venue=await detail(Venue, venue_id))
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@async_pages.route('/artists')
+async def artists():
+    genre = request.args.get('genre')
+    state = request.args.get('state')
+    rows, facets = await asyncio.gather(
+        fetch(artists_query(genre, state)),
+        fetch(facet_query(Artist, artist_genre, artist_genre.c.artist_id, genre, state)),
+    )
+    data = [{'id': row.id, 'name': row.name} for row in rows]
+    return await render_template('pages/artists.html', artists=data, facets=group_facets(facets),
+                                 genre=genre, state=state)
+
+@async_pages.route('/artists/<int:artist_id>')
+async def show_artist(artist_id):
+    return await render_template('pages/show_artist.html', artist=await detail(Artist, artist_id))
+
+async def detail(model, id):
+    # The row with its genres, its past shows and its upcoming shows at once.
+    now = clock.now()
+    owner, past_shows, upcoming_shows = await asyncio.gather(
+        fetch_one(db.select(model).options(selectinload(model.genres)).where(model.id == id)),
+        fetch(detail_shows_query(model, id, now, upcoming=False)),
+        fetch(detail_shows_query(model, id, now, upcoming=True)),
+    )
+    if owner is None:
+        abort(404)
+    return add_shows(details(owner), model, past_shows, upcoming_shows)
+
+#  Search
+#  ----------------------------------------------------------------
+
+@async_pages.route('/venues/search', methods=['POST'])
+async def search_venues():
+    return await search_page(Venue, 'pages/search_venues.html')
+
+@async_pages.route('/artists/search', methods=['POST'])
+async def search_artists():
+    return await search_page(Artist, 'pages/search_artists.html')
+
+async def search_page(model, template_name):
+    search_term = request.form.get('search_term', '')
+    # The in-memory index (non-PostgreSQL) is built by the sync session on
+    # first use and kept in step by its session events.
+    query, ids = search.search_query(model, search_term)
+    rows = search.in_order(await fetch(query), ids) if query is not None else []
+    results = {
+        'count': len(rows),
+        'data': [{'id': row.id, 'name': row.name, 'num_upcoming_shows': row.num_upcoming_shows}
+                 for row in rows]
+    }
+    return await render_template(template_name, results=results, search_term=search_term)
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@async_pages.route('/shows')
+async def shows():
+    per_page = min(max(request.args.get('per_page', SHOWS_PER_PAGE, type=int), 1), SHOWS_MAX_PER_PAGE)
+    cursor = request.args.get('cursor')
+    try:
+        after = parse_cursor(cursor) if cursor else None
+    except ValueError:
+        abort(400)
+    data, next_cursor = shows_page(await fetch(shows_query(after, per_page)), per_page)
+    return await render_template('pages/shows.html', shows=data, per_page=per_page,
+                                 cursor=cursor, next_cursor=next_cursor)
@@ -0,0 +1,306 @@
+import bisect
+from array import array
+import heapq
+import logging
+import re
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event, inspect, or_, select
+from flask_sqlalchemy.session import Session
+from models import Venue, Artist
+from search import escape_like
+#----------------------------------------------------------------------------#
+# Venue/Artist name autocomplete (/api/autocomplete).
+#
+# Each process keeps a sorted array of the casefolded name tails that start
+# at a word boundary ("the musical hop", "musical hop", "hop"), so a lookup
+# is a bisect to the first key >= the query plus a scan of the next few
+# keys, independent of the number of names. The indexes are built in a
+# background thread on the first request; until they are ready lookups go
+# to the database instead.
+#
+# Committed ORM changes are applied to the index as they happen. Names
+# created by other processes are fetched by id every AUTOCOMPLETE_REFRESH
+# seconds; their edits and deletes, and bulk writes, show up when the index
+# is rebuilt, at the latest after AUTOCOMPLETE_MAX_AGE seconds.
+#----------------------------------------------------------------------------#
+
+logger = logging.getLogger('fyyur.autocomplete')
+
+MODELS = {'venue': Venue, 'artist': Artist}
+
+# Seconds before a failed index build is retried.
+RETRY_AFTER = 60
+
+# Main index entries pack (row << OFFSET_BITS | offset of the word start).
+OFFSET_BITS = 16
+
+WORD = re.compile(r'\w+')
+
+def starts(folded):
+    """ Offsets of the word starts in a casefolded name, and of the name
+    itself when it starts with punctuation. """
+    offsets = [match.start() for match in WORD.finditer(folded, 0, 1 << OFFSET_BITS)]
+    if folded and (not offsets or offsets[0]):
+        offsets.insert(0, 0)
+    return offsets
+
+def keys(name):
+    """ The casefolded tails of `name` from each word start. """
+    folded = (name or '').casefold()
+    return [folded[offset:] for offset in starts(folded)]
+
+class PrefixIndex:
+    """ Name tails in sorted order for bisect lookups.
+
+    The main index is an array of packed integers pointing into the names
+    it was built from; the tails are sliced off the names as they are
+    compared, so a million names cost tens of MB on top of the names
+    themselves rather than a string per word. Names added or changed later
+    go to a small sorted delta of (tail, id) pairs, where inserts don't
+    shift the whole index, and the main entries of those ids are skipped.
+    """
+
+    def __init__(self, rows=()):
+        self._names = {}
+        self._main_names = []
+        self._main_ids = array('q')
+        entries = []
+        tails = []
+        for id, name in rows:
+            name = name or ''
+            self._names[id] = name
+            row = len(self._main_names)
+            self._main_names.append(name)
+            self._main_ids.append(id)
+            folded = name.casefold()
+            for offset in starts(folded):
+                entries.append(row << OFFSET_BITS | offset)
+                tails.append(folded[offset:])
+        order = sorted(range(len(entries)), key=tails.__getitem__)
+        self._main = array('q', (entries[i] for i in order))
+        self._delta = []
+        self._changed = set()
+        self.max_id = max(self._main_ids, default=0)
+
+    def _tail(self, entry):
+        return self._main_names[entry >> OFFSET_BITS].casefold()[entry & ((1 << OFFSET_BITS) - 1):]
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, id, name):
+        self.remove(id)
+        self._names[id] = name
+        self.max_id = max(self.max_id, id)
+        for key in keys(name):
+            bisect.insort(self._delta, (key, id))
+
+    def remove(self, id):
+        self._changed.add(id)
+        name = self._names.pop(id, None)
+        if name is None:
+            return
+        for key in keys(name):
+            position = bisect.bisect_left(self._delta, (key, id))
+            if position < len(self._delta) and self._delta[position] == (key, id):
+                del self._delta[position]
+
+    def _scan_main(self, term):
+        # bisect_left by tail; bisect's key= needs Python 3.10.
+        low, high = 0, len(self._main)
+        while low < high:
+            middle = (low + high) // 2
+            if self._tail(self._main[middle]) < term:
+                low = middle + 1
+            else:
+                high = middle
+        for position in range(low, len(self._main)):
+            entry = self._main[position]
+            tail = self._tail(entry)
+            if not tail.startswith(term):
+                break
+            id = self._main_ids[entry >> OFFSET_BITS]
+            if id not in self._changed:
+                yield tail, id
+
+    def _scan_delta(self, term):
+        position = bisect.bisect_left(self._delta, (term,))
+        while position < len(self._delta) and self._delta[position][0].startswith(term):
+            yield self._delta[position]
+            position += 1
+
+    def lookup(self, term, limit):
+        """ Up to `limit` (id, name) pairs with a word starting with `term`,
+        in key order. """
+        term = term.casefold()
+        found = {}
+        for key, id in heapq.merge(self._scan_main(term), self._scan_delta(term)):
+            found.setdefault(id, self._names[id])
+            if len(found) >= limit:
+                break
+        return list(found.items())
+
+class Autocomplete:
+    def __init__(self, db=None, app=None):
+        self.db = db
+        self._indexes = {}
+        # model -> (changes committed while its index is being built, the
+        # generation the build started at)
+        self._builds = {}
+        self._built_at = {}
+        self._refreshed_at = {}
+        self._failed_at = {}
+        self._generation = dict.fromkeys(MODELS.values(), 0)
+        self._lock = threading.Lock()
+        self._preloaded = False
+        if db is not None and app is not None:
+            self.init_app(db, app)
+
+    def init_app(self, db, app):
+        self.db = db
+        app.extensions['autocomplete'] = self
+        event.listen(Session, 'after_flush', self._collect_changes)
+        event.listen(Session, 'after_commit', self._apply_changes)
+        event.listen(Session, 'after_rollback', self._discard_changes)
+        if app.config.get('AUTOCOMPLETE_PRELOAD', True):
+            app.before_request(self._preload)
+
+    def _preload(self):
+        if not self._preloaded:
+            self._preloaded = True
+            for model in MODELS.values():
+                self.warm(model)
+
+    def lookup(self, model, term, limit):
+        """ [(id, name)] from the index, or from the database while it is
+        still cold. """
+        term = term.strip()
+        if not term:
+            return []
+        index = self._indexes.get(model)
+        max_age = current_app.config.get('AUTOCOMPLETE_MAX_AGE')
+        if index is None or (max_age and time.monotonic() - self._built_at[model] > max_age):
+            self.warm(model)
+        if index is None:
+            return self.query(model, term, limit)
+        refresh = current_app.config.get('AUTOCOMPLETE_REFRESH')
+        if refresh and time.monotonic() - self._refreshed_at[model] > refresh:
+            self.refresh(model, index)
+        with self._lock:
+            return index.lookup(term, limit)
+
+    def refresh(self, model, index):
+        """ Add the rows created since the index last saw an id; this picks
+        up names created by other processes between rebuilds. """
+        self._refreshed_at[model] = time.monotonic()
+        rows = self.db.session.execute(
+            select(model.id, model.name).where(model.id > index.max_id)).all()
+        with self._lock:
+            for id, name in rows:
+                index.add(id, name or '')
+
+    def query(self, model, term, limit):
+        # Word-start matches, as in the index. On PostgreSQL the name trigram
+        # index serves the ILIKEs.
+        pattern = escape_like(term) + '%'
+        return self.db.session.execute(
+            select(model.id, model.name).where(or_(
+                model.name.ilike(pattern, escape='\\'),
+                model.name.ilike('% ' + pattern, escape='\\'),
+            )).order_by(model.name).limit(limit)
+        ).all()
+
+    def warm(self, model):
+        """ Build the model's index in the background, unless a build is
+        already running; the current index, if any, serves until then. """
+        with self._lock:
+            if model in self._builds or time.monotonic() - self._failed_at.get(model, -RETRY_AFTER) < RETRY_AFTER:
+                return
+            self._builds[model] = ([], self._generation[model])
+        app = current_app._get_current_object()
+        threading.Thread(target=self._build, args=(app, model), daemon=True,
+                         name='autocomplete-{}'.format(model.__tablename__.lower())).start()
+
+    def _build(self, app, model):
+        started = time.perf_counter()
+        try:
+            with app.app_context():
+                index = PrefixIndex(self.db.session.execute(select(model.id, model.name)))
+        except Exception:
+            logger.exception('Building the %s autocomplete index failed', model.__name__)
+            with self._lock:
+                del self._builds[model]
+                self._failed_at[model] = time.monotonic()
+            return
+        with self._lock:
+            changes, generation = self._builds.pop(model)
+            if generation != self._generation[model]:
+                # Invalidated while loading: the rows may predate a bulk write.
+                rebuild = True
+            else:
+                rebuild = False
+                for id, name in changes:
+                    if name is None:
+                        index.remove(id)
+                    else:
+                        index.add(id, name)
+                self._indexes[model] = index
+                self._built_at[model] = self._refreshed_at[model] = time.monotonic()
+        if rebuild:
+            with app.app_context():
+                self.warm(model)
+            return
+        logger.info('Built the %s autocomplete index: %d names in %.2fs',
+                    model.__name__, len(index), time.perf_counter() - started)
+
+    def invalidate(self, model):
+        """ Drop the index after bulk writes; lookups use the database until
+        it is rebuilt. """
+        with self._lock:
+            self._indexes.pop(model, None)
+            self._generation[model] += 1
+
+    def forget(self, model, ids):
+        """ Drop ids removed behind the ORM's back (bulk deletes). """
+        with self._lock:
+            index = self._indexes.get(model)
+            build = self._builds.get(model)
+            for id in ids:
+                if build is not None:
+                    build[0].append((id, None))
+                if index is not None:
+                    index.remove(id)
+
+    def _collect_changes(self, session, flush_context):
+        changes = session.info.setdefault('autocomplete_changes', [])
+        for obj in session.new:
+            if type(obj) in self._generation:
+                changes.append((type(obj), obj.id, obj.name or ''))
+        for obj in session.dirty:
+            if type(obj) in self._generation and inspect(obj).attrs.name.history.has_changes():
+                changes.append((type(obj), obj.id, obj.name or ''))
+        for obj in session.deleted:
+            if type(obj) in self._generation:
+                changes.append((type(obj), obj.id, None))
+
+    def _apply_changes(self, session):
+        changes = session.info.pop('autocomplete_changes', [])
+        if not changes:
+            return
+        with self._lock:
+            for model, id, name in changes:
+                index = self._indexes.get(model)
+                build = self._builds.get(model)
+                if build is not None:
+                    build[0].append((id, name))
+                if index is None:
+                    continue
+                if name is None:
+                    index.remove(id)
+                else:
+                    index.add(id, name)
+
+    def _discard_changes(self, session):
+        session.info.pop('autocomplete_changes', None)
@@ -0,0 +1,60 @@
+""" Microbenchmark of the `datetime` Jinja filter.
+
+Compares the original filter (dateutil parse + babel pattern parse on every
+call) with filters.format_datetime on a /shows-like workload: many tiles,
+few distinct start times.
+
+    python bench/datetime_filter.py [--tiles 5000] [--distinct 200] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import babel.dates
+import dateutil.parser
+from filters import format_datetime, _format_datetime
+
+def legacy_format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format, locale='en')
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument('--tiles', type=int, default=5000)
+  parser.add_argument('--distinct', type=int, default=200)
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  start = datetime(2026, 1, 1, 20, 0, tzinfo=timezone.utc)
+  times = [start + timedelta(hours=i % args.distinct) for i in range(args.tiles)]
+  strings = [t.isoformat() for t in times]
+
+  for value, string in zip(times[:args.distinct], strings):
+    for format in ('full', 'medium'):
+      assert format_datetime(value, format) == legacy_format_datetime(string, format)
+
+  def run(name, fn, values):
+    def page():
+      for value in values:
+        fn(value, 'full')
+    _format_datetime.cache_clear()
+    best = min(timeit.repeat(page, number=1, repeat=args.repeat))
+    print('{:<28} {:>9.2f} ms/page {:>8.2f} us/tile'.format(name, best * 1e3, best * 1e6 / len(values)))
+    return best
+
+  print('{} tiles, {} distinct start times'.format(args.tiles, args.distinct))
+  legacy = run('legacy (string input)', legacy_format_datetime, strings)
+  run('new (string input)', format_datetime, strings)
+  new = run('new (datetime input)', format_datetime, times)
+  print('speedup: {:.1f}x'.format(legacy / new))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,164 @@
+""" Past/upcoming classification against a frozen clock.
+
+Seeds a temporary SQLite database with shows around a fixed instant,
+pins clock.now() to instants around it with Clock.frozen() and checks the
+past/upcoming split of the venue and artist pages (sync and async), the
+show counters of the API listings, and how long the page cache keeps a
+detail page. Exits non-zero when any check fails.
+
+    python bench/frozen_clock.py
+"""
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['FYYUR_ENV'] = 'test'
+# A file, not :memory:, so the async engine of the /async pages sees the rows.
+DATABASE = tempfile.NamedTemporaryFile(prefix='fyyur-clock-', suffix='.db', delete=False).name
+os.environ['DATABASE_URL'] = 'sqlite:///' + DATABASE
+os.environ['SQLALCHEMY_ECHO'] = 'false'
+os.environ['AUTOCOMPLETE_PRELOAD'] = 'false'
+import config
+config.CACHE_TYPE = 'lru'
+config.ASYNC_PAGES = True
+
+from app import create_app, page_cache
+from models import db, Venue, Artist, Show, Genre
+import counters
+
+app = create_app()
+clock = app.extensions['clock']
+
+NOW = datetime(2030, 1, 1, 20, 0, tzinfo=timezone.utc)
+SECOND = timedelta(seconds=1)
+
+# (venue_id, artist_id, start_time); the second show of venue 1 starts
+# exactly at NOW.
+SHOWS = [
+  (1, 1, NOW - timedelta(days=2)),
+  (1, 2, NOW),
+  (2, 2, NOW - timedelta(days=1)),
+  (2, 1, NOW + timedelta(days=1)),
+]
+
+def seed():
+  jazz = Genre.query.filter_by(name='Jazz').one()
+  for i in (1, 2):
+    db.session.add(Venue(id=i, name='Venue {}'.format(i), city='City', state='CA', address='1 Main St',
+                         phone='123-123-1234', genres=[jazz], seeking_talent=False))
+    db.session.add(Artist(id=i, name='Artist {}'.format(i), city='City', state='CA',
+                          phone='123-123-1234', genres=[jazz]))
+  for venue_id, artist_id, start_time in SHOWS:
+    db.session.add(Show(venue_id=venue_id, artist_id=artist_id, start_time=start_time))
+  db.session.commit()
+
+def expected(kind, id, now):
+  """ (past ids, most recent first; upcoming ids, nearest first) of the
+  other side, for the page of venue or artist `id`. """
+  mine, other = (0, 1) if kind == 'venue' else (1, 0)
+  shows = sorted((show for show in SHOWS if show[mine] == id), key=lambda show: show[2])
+  past = [show[other] for show in reversed(shows) if show[2] < now]
+  upcoming = [show[other] for show in shows if show[2] >= now]
+  return past, upcoming
+
+def split(html, kind):
+  # The other side's ids linked from the Upcoming and the Past sections.
+  other = 'artists' if kind == 'venue' else 'venues'
+  upcoming, past = re.split(r'<h2 class="monospace">\d+ Past', html.split(' Upcoming ', 1)[1], maxsplit=1)
+  ids = lambda section: [int(id) for id in re.findall(r'href="/{}/(\d+)"'.format(other), section)]
+  return ids(past), ids(upcoming)
+
+class RecordingBackend:
+  """ Page cache backend wrapper keeping the timeout of the last set. """
+
+  def __init__(self, backend):
+    self.backend = backend
+    self.timeouts = {}
+
+  def get(self, key):
+    return None
+
+  def set(self, key, value, timeout=None):
+    self.timeouts[key] = timeout
+    self.backend.set(key, value, timeout)
+
+  def delete(self, *keys):
+    self.backend.delete(*keys)
+
+  @property
+  def default_timeout(self):
+    return self.backend.default_timeout
+
+def listing_counts(client, kind):
+  data = client.get('/api/v1/{}s?fields=id,upcoming_shows_count,past_shows_count'.format(kind)).json['data']
+  return {row['id']: (row['past_shows_count'], row['upcoming_shows_count']) for row in data}
+
+def expected_counts(kind, now):
+  return {id: tuple(len(ids) for ids in expected(kind, id, now)) for id in (1, 2)}
+
+def main():
+  with app.app_context():
+    db.create_all()
+    seed()
+  client = app.test_client()
+  # Every page is rendered, never served from the cache; the timeouts it
+  # would be stored with are recorded.
+  recorder = page_cache.backend = RecordingBackend(page_cache.backend)
+  checks = []
+
+  def check(name, got, want):
+    checks.append((name, got == want, got, want))
+
+  for label, now in (('before', NOW - SECOND), ('at', NOW), ('after', NOW + SECOND)):
+    with clock.frozen(now):
+      for kind in ('venue', 'artist'):
+        for id in (1, 2):
+          want = expected(kind, id, now)
+          for prefix in ('', '/async'):
+            html = client.get('{}/{}s/{}'.format(prefix, kind, id)).get_data(as_text=True)
+            check('{} NOW  {}/{}s/{}'.format(label, prefix, kind, id), split(html, kind), want)
+      # The counters move at the watermark: rebuild sets it to now.
+      with app.app_context():
+        counters.rebuild()
+      for kind in ('venue', 'artist'):
+        check('{} NOW  /api/v1/{}s counters'.format(label, kind), listing_counts(client, kind),
+              expected_counts(kind, now))
+
+  # The periodic job moves the show starting at NOW to past once NOW is over.
+  with clock.frozen(NOW - SECOND):
+    with app.app_context():
+      counters.rebuild()
+  with clock.frozen(NOW + SECOND):
+    with app.app_context():
+      moved = counters.roll_forward()
+    check('roll-forward past NOW moves 1 show', moved, 1)
+    for kind in ('venue', 'artist'):
+      check('roll-forward past NOW  /api/v1/{}s counters'.format(kind), listing_counts(client, kind),
+            expected_counts(kind, NOW + SECOND))
+
+  # A cached detail page is kept until its next show starts, at most for
+  # CACHE_DEFAULT_TIMEOUT.
+  for before, want in ((30, 30), (1, 1), (3600, app.config['CACHE_DEFAULT_TIMEOUT'])):
+    with clock.frozen(NOW - timedelta(seconds=before)):
+      client.get('/venues/1')
+    check('page cache timeout {}s before a show'.format(before), recorder.timeouts.get('venue:1'), want)
+  with clock.frozen(NOW + timedelta(days=2)):
+    client.get('/venues/1')
+  check('page cache timeout with no upcoming show', recorder.timeouts.get('venue:1'), None)
+
+  failed = False
+  for name, passed, got, want in checks:
+    failed = failed or not passed
+    print('{:<48} {}'.format(name, 'ok' if passed else 'FAIL: got {!r}, expected {!r}'.format(got, want)))
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  try:
+    status = main()
+  finally:
+    os.remove(DATABASE)
+  sys.exit(status)
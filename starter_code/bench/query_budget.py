@@ -0,0 +1,107 @@
+""" SQL statement budget per endpoint.
+
+Seeds an in-memory SQLite database, requests every read-only page through
+the Flask test client and counts the statements each one issues. Exits
+non-zero when an endpoint goes over its budget, e.g. after a relationship
+falls back to per-row lazy loading.
+
+    python bench/query_budget.py
+"""
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['FYYUR_ENV'] = 'test'
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['SQLALCHEMY_ECHO'] = 'false'
+# No background index builds racing the statement counts.
+os.environ['AUTOCOMPLETE_PRELOAD'] = 'false'
+import config
+config.CACHE_TYPE = 'null'
+
+from sqlalchemy import event
+from app import create_app
+from models import db, Venue, Artist, Show, Genre
+
+app = create_app()
+
+VENUES = 20
+ARTISTS = 20
+SHOWS_PER_VENUE = 30
+
+# (method, url, data) -> maximum number of statements.
+BUDGETS = {
+  # Listing + one UNION ALL facet count query.
+  ('GET', '/venues', None): 2,
+  ('GET', '/artists', None): 2,
+  ('GET', '/shows', None): 1,
+  # Row + genres selectin + joined show query.
+  ('GET', '/venues/1', None): 3,
+  ('GET', '/artists/1', None): 3,
+  ('POST', '/venues/search', (('search_term', 'venue'),)): 1,
+  ('POST', '/artists/search', (('search_term', 'artist'),)): 1,
+  ('GET', '/venues/1/edit', None): 2,
+  ('GET', '/artists/1/edit', None): 2,
+  # Rows + genres selectin; without genres, the rows alone.
+  ('GET', '/api/v1/venues', None): 2,
+  ('GET', '/api/v1/venues?fields=id,name', None): 1,
+  ('GET', '/api/v1/artists/1', None): 2,
+  ('GET', '/api/v1/shows', None): 1,
+}
+
+def seed():
+  now = datetime.now(timezone.utc).replace(microsecond=0)
+  jazz, folk = Genre.query.filter(Genre.name.in_(['Jazz', 'Folk'])).order_by(Genre.id).all()
+  for i in range(1, VENUES + 1):
+    db.session.add(Venue(
+      id=i, name='Venue {}'.format(i), city='City {}'.format(i % 5), state='CA', address='1 Main St',
+      phone='123-123-1234', genres=[jazz, folk], seeking_talent=False))
+  for i in range(1, ARTISTS + 1):
+    db.session.add(Artist(
+      id=i, name='Artist {}'.format(i), city='City {}'.format(i % 5), state='CA',
+      phone='123-123-1234', genres=[jazz]))
+  # A venue plays daily; an artist plays every venue on one day, three
+  # hours apart, so nobody is double-booked.
+  for venue_id in range(1, VENUES + 1):
+    for n in range(SHOWS_PER_VENUE):
+      db.session.add(Show(
+        venue_id=venue_id, artist_id=n % ARTISTS + 1,
+        start_time=now + timedelta(days=n - SHOWS_PER_VENUE // 2, hours=3 * venue_id)))
+  db.session.commit()
+
+def count_statements(client, method, url, data):
+  statements = []
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+  with app.app_context():
+    engine = db.engine
+  event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+  try:
+    response = client.open(url, method=method, data=dict(data or ()))
+  finally:
+    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+  if response.status_code != 200:
+    raise AssertionError('{} {} returned {}'.format(method, url, response.status_code))
+  return len(statements)
+
+def main():
+  with app.app_context():
+    db.create_all()
+    seed()
+  client = app.test_client()
+  # Warm up lazily built structures (e.g. the in-memory search index).
+  for method, url, data in BUDGETS:
+    client.open(url, method=method, data=dict(data or ()))
+
+  failed = False
+  for (method, url, data), budget in BUDGETS.items():
+    count = count_statements(client, method, url, data)
+    status = 'ok' if count <= budget else 'OVER BUDGET'
+    failed = failed or count > budget
+    print('{:<5} {:<20} {:>3} / {:<3} {}'.format(method, url, count, budget, status))
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,307 @@
+""" Latency, throughput and queries-per-request for every route.
+
+Seeds a database with bench/seed.py, then measures each route twice:
+
+  client  in-process through the Flask test client, one request at a time
+  http    over a local threaded server, driven by --concurrency workers
+          (read-only routes; writes are measured by the client phase only)
+
+and reports p50/p95/p99 latency, requests/s and statements per request.
+Results are written as JSON so runs can be diffed between commits:
+
+    python bench/routes.py --shows 100k --output before.json
+    python bench/routes.py --shows 100k --output after.json --compare before.json
+
+The page cache is off unless --cache is given, so the numbers cover the
+database path.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import seed as seeding
+
+# Export routes stream the whole catalog; they get a fraction of the runs.
+HEAVY = {'main.export_shows'}
+
+# Ids per batch delete request, and shows per deleted venue or artist.
+DELETE_BATCH = 10
+DOOMED_SHOWS = 10
+
+def routes(db):
+  """ (name, endpoint, method, url or url(i), form data or data(i), writes) """
+  from sqlalchemy import func, select
+  from models import Venue, Artist, Show, Genre
+
+  venue_id = db.session.scalar(select(Venue.id).order_by(Venue.id))
+  artist_id = db.session.scalar(select(Artist.id).order_by(Artist.id))
+  genre = db.session.scalar(select(Genre.name).order_by(Genre.id))
+  term = db.session.scalar(select(Venue.name).order_by(Venue.id)).split()[0]
+  # Created shows count down from before the earliest one, so reruns on the
+  # same data never double-book the venue or the artist.
+  earliest = db.session.scalar(select(func.min(Show.start_time))) or datetime.now(timezone.utc)
+  earliest = earliest.replace(tzinfo=None, microsecond=0)
+  # Venues and artists created up front for the delete routes, one per run
+  # or DELETE_BATCH per run for the batch routes, each pair sharing
+  # DOOMED_SHOWS shows so the cascade has rows to delete.
+  doomed = {'venue': [], 'artist': [], 'venues': [], 'artists': []}
+
+  def form(**fields):
+    data = {'city': 'Austin', 'state': 'TX', 'phone': '123-123-1234', 'genres': ['Jazz'],
+            'facebook_link': 'https://facebook.com/bench', 'image_link': '', 'website_link': '',
+            'seeking_description': ''}
+    data.update(fields)
+    return data
+
+  def delete_batch(kind):
+    return lambda i: {'ids': doomed[kind][i * DELETE_BATCH:(i + 1) * DELETE_BATCH]}
+
+  def prepare_deletes(n):
+    start = earliest - timedelta(days=1)
+    for kind, count in (('venue', n), ('artist', n), ('venues', n * DELETE_BATCH), ('artists', n * DELETE_BATCH)):
+      for i in range(count):
+        venue = Venue(name='Doomed {} {}'.format(kind, i), city='Austin', state='TX', address='x', phone='123-123-1234')
+        artist = Artist(name='Doomed {} {}'.format(kind, i), city='Austin', state='TX', phone='123-123-1234',
+                        seeking_venue=False)
+        venue.shows = [Show(Artist=artist, start_time=start - timedelta(hours=j), end_time=start - timedelta(hours=j - 1))
+                       for j in range(1, DOOMED_SHOWS + 1)]
+        db.session.add(venue)
+        db.session.flush()
+        doomed[kind].append((venue if kind.startswith('venue') else artist).id)
+    db.session.commit()
+
+  table = [
+    ('home', 'main.index', 'GET', '/', None, False),
+    ('venues', 'main.venues', 'GET', '/venues', None, False),
+    ('venues_faceted', 'main.venues', 'GET', '/venues?genre={}&state=CA'.format(genre), None, False),
+    ('venue', 'main.show_venue', 'GET', '/venues/{}'.format(venue_id), None, False),
+    ('venue_edit_form', 'main.edit_venue', 'GET', '/venues/{}/edit'.format(venue_id), None, False),
+    ('venue_create_form', 'main.create_venue_form', 'GET', '/venues/create', None, False),
+    ('venues_search', 'main.search_venues', 'POST', '/venues/search', {'search_term': term}, False),
+    ('artists', 'main.artists', 'GET', '/artists', None, False),
+    ('artist', 'main.show_artist', 'GET', '/artists/{}'.format(artist_id), None, False),
+    ('artist_edit_form', 'main.edit_artist', 'GET', '/artists/{}/edit'.format(artist_id), None, False),
+    ('artist_create_form', 'main.create_artist_form', 'GET', '/artists/create', None, False),
+    ('artists_search', 'main.search_artists', 'POST', '/artists/search', {'search_term': term}, False),
+    ('autocomplete', 'main.autocomplete_names', 'GET', '/api/autocomplete?type=venue&q={}'.format(term[:3]), None, False),
+    ('shows', 'main.shows', 'GET', '/shows', None, False),
+    ('shows_per_page_100', 'main.shows', 'GET', '/shows?per_page=100', None, False),
+    ('show_create_form', 'main.create_shows', 'GET', '/shows/create', None, False),
+    ('export_csv', 'main.export_shows', 'GET', '/export/shows.csv', None, False),
+    ('export_jsonl', 'main.export_shows', 'GET', '/export/shows.jsonl', None, False),
+    ('metrics', 'main.metrics', 'GET', '/metrics', None, False),
+    ('api_venues', 'api.venues', 'GET', '/api/v1/venues', None, False),
+    ('api_venues_fields', 'api.venues', 'GET', '/api/v1/venues?fields=id,name&per_page=500', None, False),
+    ('api_venue', 'api.venue', 'GET', '/api/v1/venues/{}'.format(venue_id), None, False),
+    ('api_artists', 'api.artists', 'GET', '/api/v1/artists', None, False),
+    ('api_artist', 'api.artist', 'GET', '/api/v1/artists/{}'.format(artist_id), None, False),
+    ('api_shows', 'api.shows', 'GET', '/api/v1/shows?per_page=100', None, False),
+    ('venue_create', 'main.create_venue_submission', 'POST', '/venues/create',
+     lambda i: form(name='Bench Venue {}'.format(i), address='1 Bench St'), True),
+    ('venue_edit', 'main.edit_venue_submission', 'POST', '/venues/{}/edit'.format(venue_id),
+     lambda i: form(name='Edited Venue {}'.format(i), address='2 Bench St'), True),
+    ('artist_create', 'main.create_artist_submission', 'POST', '/artists/create',
+     lambda i: form(name='Bench Artist {}'.format(i)), True),
+    ('artist_edit', 'main.edit_artist_submission', 'POST', '/artists/{}/edit'.format(artist_id),
+     lambda i: form(name='Edited Artist {}'.format(i)), True),
+    ('show_create', 'main.create_show_submission', 'POST', '/shows/create', lambda i: {
+      'venue_id': venue_id, 'artist_id': artist_id,
+      'start_time': (earliest - timedelta(minutes=2 * (i + 1))).strftime('%Y-%m-%d %H:%M:%S'),
+      'duration': 1,
+    }, True),
+    ('venue_delete', 'main.delete_venue', 'POST', lambda i: '/venues/{}/delete'.format(doomed['venue'][i]), None, True),
+    ('artist_delete', 'main.delete_artist', 'POST', lambda i: '/artists/{}/delete'.format(doomed['artist'][i]), None, True),
+    ('venues_delete', 'main.delete_venues', 'POST', '/venues/delete', delete_batch('venues'), True),
+    ('artists_delete', 'main.delete_artists', 'POST', '/artists/delete', delete_batch('artists'), True),
+  ]
+  return table, prepare_deletes
+
+class StatementCounter:
+  def __init__(self, engine):
+    from sqlalchemy import event
+    self.count = 0
+    self._lock = threading.Lock()
+    event.listen(engine, 'before_cursor_execute', self)
+
+  def __call__(self, conn, cursor, statement, parameters, context, executemany):
+    with self._lock:
+      self.count += 1
+
+def summarize(latencies, statements, wall):
+  latencies = sorted(latencies)
+  cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+  return {
+    'requests': len(latencies),
+    'p50_ms': round(cuts[49] * 1e3, 3),
+    'p95_ms': round(cuts[94] * 1e3, 3),
+    'p99_ms': round(cuts[98] * 1e3, 3),
+    'max_ms': round(latencies[-1] * 1e3, 3),
+    'rps': round(len(latencies) / wall, 1) if wall else None,
+    'statements_per_request': round(statements / len(latencies), 2),
+  }
+
+def runs_for(endpoint, requests):
+  return max(1, requests // 10) if endpoint in HEAVY else requests
+
+def resolve(value, i):
+  return value(i) if callable(value) else value
+
+def bench_client(app, counter, table, requests):
+  results = {}
+  client = app.test_client()
+  for name, endpoint, method, url, data, writes in table:
+    n = runs_for(endpoint, requests)
+    # Warm-up request (search index, template compilation); writes use their
+    # own data so every run has a fresh row to work on.
+    if not writes:
+      client.open(url, method=method, data=data).get_data()
+    latencies = []
+    before = counter.count
+    started = time.perf_counter()
+    for i in range(n):
+      t = time.perf_counter()
+      response = client.open(resolve(url, i), method=method, data=resolve(data, i))
+      response.get_data()
+      latencies.append(time.perf_counter() - t)
+      if response.status_code >= 400:
+        raise AssertionError('{} {} returned {}'.format(method, resolve(url, i), response.status_code))
+    wall = time.perf_counter() - started
+    results[name] = summarize(latencies, counter.count - before, wall)
+    print('client {:<20} {}'.format(name, format_row(results[name])))
+  return results
+
+def bench_http(app, counter, table, requests, concurrency):
+  from werkzeug.serving import make_server
+  logging.getLogger('werkzeug').setLevel(logging.WARNING)
+  server = make_server('127.0.0.1', 0, app, threaded=True)
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  base = 'http://127.0.0.1:{}'.format(server.server_port)
+
+  def fetch(method, url, data):
+    body = urllib.parse.urlencode(data, doseq=True).encode() if data else None
+    t = time.perf_counter()
+    with urllib.request.urlopen(urllib.request.Request(base + url, data=body, method=method)) as response:
+      response.read()
+    return time.perf_counter() - t
+
+  results = {}
+  try:
+    with ThreadPoolExecutor(concurrency) as pool:
+      for name, endpoint, method, url, data, writes in table:
+        if writes:
+          continue
+        n = runs_for(endpoint, requests)
+        before = counter.count
+        started = time.perf_counter()
+        latencies = list(pool.map(lambda i: fetch(method, url, data), range(n)))
+        wall = time.perf_counter() - started
+        results[name] = summarize(latencies, counter.count - before, wall)
+        print('http   {:<20} {}'.format(name, format_row(results[name])))
+  finally:
+    server.shutdown()
+  return results
+
+def format_row(result):
+  return 'p50 {p50_ms:>9.2f} ms  p95 {p95_ms:>9.2f} ms  p99 {p99_ms:>9.2f} ms  {rps:>8} req/s  {statements_per_request:>6} stmt/req'.format(**result)
+
+def compare(current, baseline_path):
+  with open(baseline_path, encoding='utf-8') as f:
+    baseline = json.load(f)
+  print('\nvs {} ({}):'.format(baseline_path, baseline['meta'].get('commit')))
+  for phase in ('client', 'http'):
+    for name, result in current.get(phase, {}).items():
+      old = baseline.get(phase, {}).get(name)
+      if not old:
+        continue
+      ratio = result['p95_ms'] / old['p95_ms'] if old['p95_ms'] else float('inf')
+      statements = result['statements_per_request'] - old['statements_per_request']
+      flag = '  <-- slower' if ratio > 1.2 else ''
+      print('{:<6} {:<20} p95 x{:<6.2f} stmt/req {:+.2f}{}'.format(phase, name, ratio, statements, flag))
+
+def git_commit():
+  try:
+    return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+  except OSError:
+    return None
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--shows', type=seeding.parse_scale, default='1k', help='1k, 100k, 1m or a number.')
+  parser.add_argument('--database-url', default=seeding.DEFAULT_DATABASE_URL)
+  parser.add_argument('--no-seed', action='store_true', help='Reuse the data already in the database.')
+  parser.add_argument('--requests', type=int, default=50, help='Requests per route and phase.')
+  parser.add_argument('--concurrency', type=int, default=8)
+  parser.add_argument('--no-http', action='store_true', help='Skip the HTTP load phase.')
+  parser.add_argument('--cache', action='store_true', help='Leave the page cache on.')
+  parser.add_argument('--output', help='Write results to this JSON file.')
+  parser.add_argument('--compare', help='Print p95 and statement deltas against a previous JSON result.')
+  args = parser.parse_args()
+
+  seeding.configure(args.database_url)
+  import config
+  if not args.cache:
+    config.CACHE_TYPE = 'null'
+  from app import create_app
+  app = create_app()
+  from models import db
+
+  with app.app_context():
+    if args.no_seed:
+      from models import Venue, Artist, Show
+      counts = {'venues': Venue.query.count(), 'artists': Artist.query.count(), 'shows': Show.query.count()}
+    else:
+      seeding.create_schema(db)
+      counts = seeding.seed(db, args.shows)
+    table, prepare_deletes = routes(db)
+    prepare_deletes(runs_for('main.delete_venue', args.requests))
+    counter = StatementCounter(db.engine)
+    dialect = db.engine.dialect.name
+
+  # Static files are served from disk and not benchmarked.
+  covered = {endpoint for _, endpoint, *_ in table} | {'static', 'assets.asset'}
+  missing = sorted(rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint not in covered)
+  if missing:
+    print('warning: routes without a benchmark: {}'.format(', '.join(missing)), file=sys.stderr)
+
+  print('{shows} shows, {venues} venues, {artists} artists on {0}'.format(dialect, **counts))
+  results = {
+    'meta': {
+      'commit': git_commit(),
+      'time': datetime.now(timezone.utc).isoformat(),
+      'python': platform.python_version(),
+      'database': dialect,
+      'cache': args.cache,
+      'requests': args.requests,
+      'concurrency': args.concurrency,
+      **counts,
+    },
+  }
+  # Writes go last so the read-only numbers come from the seeded data.
+  reads = [route for route in table if not route[-1]]
+  writes = [route for route in table if route[-1]]
+  results['client'] = bench_client(app, counter, reads + writes, args.requests)
+  if not args.no_http:
+    results['http'] = bench_http(app, counter, reads, args.requests, args.concurrency)
+
+  if args.output:
+    with open(args.output, 'w', encoding='utf-8') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+  if args.compare:
+    compare(results, args.compare)
+
+if __name__ == '__main__':
+  main()
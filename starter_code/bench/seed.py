@@ -0,0 +1,127 @@
+""" Synthetic venues, artists and shows for the benchmarks.
+
+Drops and recreates the schema of the target database, then bulk-inserts
+`--shows` shows spread over two years around today (half past, half
+upcoming), with one venue and one artist per 100 shows.
+
+    python bench/seed.py [--shows 1k|100k|1m|N] [--database-url URL]
+
+Point --database-url at a throwaway database: its tables are dropped.
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_DATABASE_URL = 'sqlite:////tmp/fyyur-bench.db'
+SCALES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+BATCH = 10000
+SPAN = timedelta(days=730)
+
+WORDS = ('Blue', 'Velvet', 'Echo', 'Lounge', 'Garage', 'Hall', 'Room', 'Cellar', 'Sound',
+         'Park', 'Moon', 'Tiger', 'River', 'Static', 'Neon', 'Harbor', 'Union', 'Crown')
+CITIES = (('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Seattle', 'WA'),
+          ('Chicago', 'IL'), ('Nashville', 'TN'), ('Portland', 'OR'), ('Denver', 'CO'))
+
+def parse_scale(value):
+  return SCALES.get(value.lower()) or int(value)
+
+def configure(database_url):
+  # config.py reads these at import time, so call this before importing app.
+  os.environ.setdefault('FYYUR_ENV', 'test')
+  os.environ['DATABASE_URL'] = database_url
+  os.environ['SQLALCHEMY_ECHO'] = 'false'
+
+def batches(rows, size=BATCH):
+  batch = []
+  for row in rows:
+    batch.append(row)
+    if len(batch) >= size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+def create_schema(db):
+  if db.engine.dialect.name == 'postgresql':
+    db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS btree_gist'))
+    db.session.commit()
+  db.drop_all()
+  db.create_all()
+
+def seed(db, shows, rng_seed=0):
+  """ Fill an empty schema; returns the row counts. """
+  from sqlalchemy import insert, select
+  from models import Venue, Artist, Show, Genre, venue_genre, artist_genre
+  import counters
+
+  rng = random.Random(rng_seed)
+  owners = max(10, shows // 100)
+  genre_ids = list(db.session.scalars(select(Genre.id)))
+
+  def name(i, kind):
+    return '{} {} {} {}'.format(rng.choice(WORDS), rng.choice(WORDS), kind, i)
+
+  def owner_row(i, kind):
+    city, state = CITIES[i % len(CITIES)]
+    return {
+      'id': i, 'name': name(i, kind), 'city': city, 'state': state, 'phone': '123-123-1234',
+      'image_link': 'https://example.com/{}/{}.png'.format(kind.lower(), i),
+      'facebook_link': 'https://facebook.com/{}{}'.format(kind.lower(), i),
+    }
+
+  venues = ({**owner_row(i, 'Venue'), 'address': '{} Main St'.format(i), 'seeking_talent': i % 3 == 0}
+            for i in range(1, owners + 1))
+  artists = ({**owner_row(i, 'Artist'), 'seeking_venue': i % 4 == 0} for i in range(1, owners + 1))
+  for model, association, fk, rows in ((Venue, venue_genre, 'venue_id', venues),
+                                       (Artist, artist_genre, 'artist_id', artists)):
+    for batch in batches(rows):
+      db.session.execute(insert(model), batch)
+      db.session.execute(insert(association), [
+        {fk: row['id'], 'genre_id': genre_id}
+        for row in batch for genre_id in rng.sample(genre_ids, rng.randint(1, 3))
+      ])
+    db.session.commit()
+
+  # Evenly spaced, distinct start times keep the (venue, artist, start_time)
+  # primary key unique without checking. Every run of `owners` shows has
+  # each venue and each artist once, artists rotating against venues from
+  # run to run, so a venue or artist plays about every SPAN / 100 and its
+  # shows never overlap.
+  start = datetime.now(timezone.utc).replace(microsecond=0) - SPAN / 2
+  step = SPAN / shows
+  lineup = rng.sample(range(1, owners + 1), owners)
+  show_rows = ({
+    'venue_id': i % owners + 1,
+    'artist_id': lineup[(i % owners + i // owners) % owners],
+    'start_time': start + step * i,
+  } for i in range(shows))
+  for batch in batches(show_rows):
+    db.session.execute(insert(Show), batch)
+    db.session.commit()
+  # Core inserts skip the counter events; count everything once at the end.
+  counters.rebuild()
+  return {'venues': owners, 'artists': owners, 'shows': shows}
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--shows', type=parse_scale, default='1k')
+  parser.add_argument('--database-url', default=DEFAULT_DATABASE_URL)
+  parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+  args = parser.parse_args()
+
+  configure(args.database_url)
+  from app import create_app
+  app = create_app()
+  from models import db
+  with app.app_context():
+    create_schema(db)
+    counts = seed(db, args.shows, args.seed)
+  print('Seeded {venues} venues, {artists} artists, {shows} shows.'.format(**counts))
+
+if __name__ == '__main__':
+  main()
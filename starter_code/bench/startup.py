@@ -0,0 +1,84 @@
+""" Cold start: time to import app.py and run create_app().
+
+Starts fresh interpreters under `python -X importtime`, reports the median
+startup time and the packages that take most of it, and exits non-zero
+when the median goes over --budget-ms or when a module that the app defers
+until first use shows up at startup:
+
+    python bench/startup.py
+    python bench/startup.py --runs 10 --budget-ms 400 --top 20
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported on first use, never by create_app(): `flask db` (alembic, mako),
+# `flask import`, the /async pages and the date filter's parser.
+DEFERRED = ('flask_migrate', 'alembic', 'mako', 'importer', 'async_pages', 'dateutil.parser')
+
+SCRIPT = '''
+import time
+started = time.perf_counter()
+from app import create_app
+create_app()
+print((time.perf_counter() - started) * 1e3)
+'''
+
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+def run_once():
+  env = dict(os.environ, FYYUR_ENV='test', DATABASE_URL='sqlite://')
+  result = subprocess.run([sys.executable, '-X', 'importtime', '-c', SCRIPT], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+  modules = {}
+  for match in LINE.finditer(result.stderr):
+    self_us, cumulative_us, indent, name = match.groups()
+    modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+  return float(result.stdout.strip().splitlines()[-1]), modules
+
+def by_package(modules):
+  # Self time summed per top-level package.
+  totals = defaultdict(int)
+  for name, (self_us, _, _) in modules.items():
+    totals[name.split('.')[0]] += self_us
+  return sorted(totals.items(), key=lambda item: -item[1])
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--runs', type=int, default=5)
+  parser.add_argument('--budget-ms', type=float, default=800, help='Maximum median startup time.')
+  parser.add_argument('--top', type=int, default=15, help='Packages to list.')
+  args = parser.parse_args()
+
+  # One warm-up run writes the .pyc files, so the runs measure imports
+  # rather than compilation.
+  run_once()
+  runs = [run_once() for _ in range(args.runs)]
+  timings = [elapsed for elapsed, _ in runs]
+  modules = runs[-1][1]
+
+  print('{} modules imported'.format(len(modules)))
+  print('{:<28} {:>10}'.format('package', 'self ms'))
+  for package, self_us in by_package(modules)[:args.top]:
+    print('{:<28} {:>10.1f}'.format(package, self_us / 1e3))
+
+  failed = False
+  deferred = [name for name in modules if name in DEFERRED]
+  for name in deferred:
+    print('DEFERRED MODULE IMPORTED AT STARTUP: {}'.format(name))
+    failed = True
+  median = statistics.median(timings)
+  status = 'ok' if median <= args.budget_ms else 'OVER BUDGET'
+  failed = failed or median > args.budget_ms
+  print('startup  median {:.0f} ms  min {:.0f} ms  / {:.0f} ms  {}'.format(
+    median, min(timings), args.budget_ms, status))
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
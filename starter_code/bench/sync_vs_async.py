@@ -0,0 +1,134 @@
+""" Sync vs async read-only pages under concurrent load.
+
+Seeds a database with bench/seed.py and drives every read-only page with
+--concurrency clients in three setups:
+
+  wsgi        sync views on a threaded WSGI server (werkzeug)
+  asgi-sync   sync views through asgi.py under uvicorn
+  asgi-async  the /async views through asgi.py under uvicorn
+
+reporting p50/p95/p99 latency and requests/s for each.
+
+    python bench/sync_vs_async.py [--shows 100k] [--concurrency 64] [--output async.json]
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import seed as seeding
+from routes import summarize, format_row, git_commit
+
+def pages(db):
+  from sqlalchemy import select
+  from models import Venue, Artist
+  venue_id = db.session.scalar(select(Venue.id).order_by(Venue.id))
+  artist_id = db.session.scalar(select(Artist.id).order_by(Artist.id))
+  term = db.session.scalar(select(Venue.name).order_by(Venue.id)).split()[0]
+  return [
+    ('venues', 'GET', '/venues', None),
+    ('venue', 'GET', '/venues/{}'.format(venue_id), None),
+    ('artists', 'GET', '/artists', None),
+    ('artist', 'GET', '/artists/{}'.format(artist_id), None),
+    ('shows', 'GET', '/shows', None),
+    ('venues_search', 'POST', '/venues/search', {'search_term': term}),
+    ('artists_search', 'POST', '/artists/search', {'search_term': term}),
+  ]
+
+def free_port():
+  with socket.socket() as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+def serve_wsgi(app):
+  from werkzeug.serving import make_server
+  server = make_server('127.0.0.1', 0, app, threaded=True)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return 'http://127.0.0.1:{}'.format(server.server_port), server.shutdown
+
+def serve_asgi(asgi_app):
+  import uvicorn
+  port = free_port()
+  server = uvicorn.Server(uvicorn.Config(asgi_app, host='127.0.0.1', port=port,
+                                         log_level='warning', lifespan='off'))
+  threading.Thread(target=server.run, daemon=True).start()
+  while not server.started:
+    time.sleep(0.05)
+  def stop():
+    server.should_exit = True
+  return 'http://127.0.0.1:{}'.format(port), stop
+
+def drive(base, prefix, table, requests, concurrency):
+  def fetch(method, url, data):
+    body = urllib.parse.urlencode(data).encode() if data else None
+    t = time.perf_counter()
+    with urllib.request.urlopen(urllib.request.Request(base + prefix + url, data=body, method=method)) as response:
+      response.read()
+    return time.perf_counter() - t
+
+  results = {}
+  with ThreadPoolExecutor(concurrency) as pool:
+    for name, method, url, data in table:
+      fetch(method, url, data)
+      started = time.perf_counter()
+      latencies = list(pool.map(lambda i: fetch(method, url, data), range(requests)))
+      results[name] = summarize(latencies, 0, time.perf_counter() - started)
+      del results[name]['statements_per_request']
+  return results
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--shows', type=seeding.parse_scale, default='1k', help='1k, 100k, 1m or a number.')
+  parser.add_argument('--database-url', default=seeding.DEFAULT_DATABASE_URL)
+  parser.add_argument('--no-seed', action='store_true', help='Reuse the data already in the database.')
+  parser.add_argument('--requests', type=int, default=200, help='Requests per page and setup.')
+  parser.add_argument('--concurrency', type=int, default=32)
+  parser.add_argument('--output', help='Write results to this JSON file.')
+  args = parser.parse_args()
+
+  seeding.configure(args.database_url)
+  os.environ['ASYNC_PAGES'] = 'true'
+  import config
+  config.CACHE_TYPE = 'null'
+  import asgi
+  app = asgi.flask_app
+  from models import db
+  logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+  with app.app_context():
+    if not args.no_seed:
+      seeding.create_schema(db)
+      seeding.seed(db, args.shows)
+    table = pages(db)
+    dialect = db.engine.dialect.name
+
+  setups = (
+    ('wsgi', lambda: serve_wsgi(app), ''),
+    ('asgi-sync', lambda: serve_asgi(asgi.app), ''),
+    ('asgi-async', lambda: serve_asgi(asgi.app), '/async'),
+  )
+  results = {'meta': {'commit': git_commit(), 'database': dialect, 'requests': args.requests,
+            'concurrency': args.concurrency}}
+  for setup, serve, prefix in setups:
+    base, stop = serve()
+    try:
+      results[setup] = drive(base, prefix, table, args.requests, args.concurrency)
+    finally:
+      stop()
+    for name, result in results[setup].items():
+      print('{:<10} {:<16} {}'.format(setup, name, format_row(dict(result, statements_per_request='-'))))
+
+  if args.output:
+    with open(args.output, 'w', encoding='utf-8') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+  main()
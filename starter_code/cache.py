@@ -0,0 +1,216 @@
+from collections import OrderedDict
+from functools import wraps
+import math
+import threading
+import time
+from flask import g, request, session
+import clock
+#----------------------------------------------------------------------------#
+# Rendered page cache.
+#
+# Pages are stored under explicit keys ('venues', 'venue:3', ...) and evicted
+# by the handlers that change them. Paginated pages live in a namespace
+# ('shows') whose keys are dropped together by bumping its generation. A view
+# whose page goes stale at a known time (a detail page when its next show
+# starts) calls expires_at() and the page is kept no longer than that.
+#
+# Config:
+#   CACHE_TYPE            'lru' (in-process), 'redis' or 'null'
+#   CACHE_LRU_SIZE        entries kept by the 'lru' backend
+#   CACHE_REDIS_URL       connection URL for the 'redis' backend
+#   CACHE_DEFAULT_TIMEOUT seconds before an entry expires
+#----------------------------------------------------------------------------#
+
+class NullCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+class LRUCache:
+    """ Thread-safe, size-bounded in-process cache with per-entry expiry. """
+
+    def __init__(self, maxsize=1024, default_timeout=None):
+        self.maxsize = maxsize
+        self.default_timeout = default_timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = timeout if timeout is not None else self.default_timeout
+        expires = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+class RedisCache:
+    """ Backend over any client with the redis-py get/set/delete interface. """
+
+    def __init__(self, client, prefix='fyyur:', default_timeout=None):
+        self.client = client
+        self.prefix = prefix
+        self.default_timeout = default_timeout
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key, value, timeout=None):
+        timeout = timeout if timeout is not None else self.default_timeout
+        self.client.set(self.prefix + key, value, ex=timeout or None)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+class LocalRedis:
+    """ In-process stand-in for a redis client, for tests and local runs. """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[name]
+                return None
+            return value
+
+    def set(self, name, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        with self._lock:
+            self._data[name] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+class PageCache:
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cache_type = app.config.get('CACHE_TYPE', 'lru')
+        timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+        if cache_type == 'lru':
+            self.backend = LRUCache(app.config.get('CACHE_LRU_SIZE', 1024), timeout)
+        elif cache_type == 'redis':
+            import redis
+            self.backend = RedisCache(redis.Redis.from_url(app.config['CACHE_REDIS_URL']), default_timeout=timeout)
+        elif cache_type == 'null':
+            self.backend = NullCache()
+        else:
+            raise ValueError('Unknown CACHE_TYPE: {}'.format(cache_type))
+        app.extensions['page_cache'] = self
+
+    def cached(self, key, namespace=None):
+        """ Cache the rendered page of a view. `key` is called with the view
+        arguments; namespaced keys are evicted with `evict_namespace`. """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                # Pages carrying flashed messages are per-user: never serve
+                # them from, or store them in, the cache.
+                if '_flashes' in session:
+                    self._count('bypasses')
+                    return view(**kwargs)
+                cache_key = key(**kwargs)
+                if namespace is not None:
+                    cache_key = '{}:{}:{}'.format(namespace, self._generation(namespace), cache_key)
+                page = self.backend.get(cache_key)
+                if page is not None:
+                    self._count('hits')
+                    return page
+                self._count('misses')
+                page = view(**kwargs)
+                if isinstance(page, str):
+                    self.backend.set(cache_key, page, self._timeout(g.pop('page_expires', None)))
+                return page
+            return wrapper
+        return decorator
+
+    def expires_at(self, when):
+        """ Called by a cached view: the page it renders is stale from
+        `when`, a timezone-aware datetime. """
+        if 'page_expires' not in g or when < g.page_expires:
+            g.page_expires = when
+
+    def _timeout(self, expires):
+        # Seconds left until `expires`, capped by the backend's default.
+        if expires is None:
+            return None
+        seconds = max(math.ceil((expires - clock.now()).total_seconds()), 1)
+        default = getattr(self.backend, 'default_timeout', None)
+        return min(seconds, default) if default else seconds
+
+    def evict(self, *keys):
+        self.backend.delete(*keys)
+
+    def evict_namespace(self, namespace):
+        # A fresh generation orphans every key of the namespace; they age
+        # out of the backend on their own.
+        self.backend.set('gen:' + namespace, repr(time.time_ns()), timeout=0)
+
+    def _generation(self, namespace):
+        generation = self.backend.get('gen:' + namespace)
+        if generation is None:
+            generation = repr(time.time_ns())
+            self.backend.set('gen:' + namespace, generation, timeout=0)
+        return generation
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'bypasses': self.bypasses,
+            'hit_ratio': self.hits / lookups if lookups else None,
+        }
+
+def query_key(*names):
+    """ Key builder for views keyed on request query parameters. """
+    return lambda **kwargs: '&'.join('{}={}'.format(name, request.args.get(name, '')) for name in names)
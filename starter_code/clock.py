@@ -0,0 +1,53 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from flask import current_app, g, has_app_context, has_request_context
+#----------------------------------------------------------------------------#
+# The current time.
+#
+# `now()` is read once per request and the same value is returned for the
+# rest of it, so every show on a page is classified past or upcoming against
+# one instant. Outside a request (CLI commands) each call reads the clock.
+#
+# The source is injectable: Clock(source=...) for a fixed or fake clock, or
+# for a while only:
+#
+#   with app.extensions['clock'].frozen(datetime(2030, 1, 1, tzinfo=timezone.utc)):
+#       client.get('/venues/1')
+#----------------------------------------------------------------------------#
+
+def system_now():
+    return datetime.now(timezone.utc)
+
+class Clock:
+    def __init__(self, app=None, source=system_now):
+        self.source = source
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['clock'] = self
+
+    def now(self):
+        """ The current time, UTC; one value per request. """
+        if not has_request_context():
+            return self.source()
+        if '_now' not in g:
+            g._now = self.source()
+        return g._now
+
+    @contextmanager
+    def frozen(self, at):
+        """ Make `now()` return `at` (timezone-aware) inside the block. """
+        source = self.source
+        self.source = lambda: at
+        try:
+            yield at
+        finally:
+            self.source = source
+
+def now():
+    """ Clock.now() of the current app's clock, or of the system clock. """
+    clock = current_app.extensions.get('clock') if has_app_context() else None
+    return (clock or _system).now()
+
+_system = Clock()
@@ -0,0 +1,35 @@
+import importlib
+import click
+#----------------------------------------------------------------------------#
+# CLI commands imported on first use.
+#
+# `flask --help` lists a LazyCommand from its help text alone; the module
+# behind it is imported only when the command runs. Commands whose modules
+# are slow to import (Flask-Migrate pulls in alembic and mako) then stay out
+# of the startup of every worker and every other command.
+#----------------------------------------------------------------------------#
+
+class LazyCommand(click.Command):
+    def __init__(self, name, load, help):
+        """ `load` is 'module:attribute' or a callable returning the command. """
+        super().__init__(name, help=help)
+        self.load = load
+
+    def resolve(self):
+        if callable(self.load):
+            return self.load()
+        module, _, attribute = self.load.partition(':')
+        return getattr(importlib.import_module(module), attribute)
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        # The real command parses the arguments and is the one invoked.
+        return self.resolve().make_context(info_name, args, parent=parent, **extra)
+
+def migrate_command(app, db):
+    """ `flask db`: Flask-Migrate, initialized when a db command runs. """
+    def load():
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as db_command
+        Migrate(app, db)
+        return db_command
+    return LazyCommand('db', load, help='Perform database migrations.')
@@ -1,15 +1,120 @@
 import os
-SECRET_KEY = os.urandom(32)
+from sqlalchemy.pool import NullPool
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+def env_flag(name, default):
+    return os.environ.get(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+# Deployment profile: 'development', 'test' or 'production'. Each one only
+# changes defaults; the individual settings below can still be overridden.
+ENV = os.environ.get('FYYUR_ENV', 'development')
+PROFILES = {
+    #               debug  pool  overflow  recycle  statement timeout (ms)
+    'development': (True,  5,    5,        1800,    0),
+    'test':        (False, 2,    0,        -1,      5000),
+    'production':  (False, 10,   5,        1800,    15000),
+}
+if ENV not in PROFILES:
+    raise ValueError('Unknown FYYUR_ENV: {}'.format(ENV))
+_debug, _pool_size, _max_overflow, _recycle, _statement_timeout = PROFILES[ENV]
+
+# Signs the session cookie, flashed messages included. It must be the same in
+# every worker and survive restarts, so production needs it set; elsewhere a
+# fixed development key keeps sessions valid across reloads.
+SECRET_KEY = os.environ.get('SECRET_KEY')
+if not SECRET_KEY:
+    if ENV == 'production':
+        raise ValueError('SECRET_KEY must be set when FYYUR_ENV is production')
+    SECRET_KEY = 'fyyur-development-key'
+
 # Enable debug mode.
-DEBUG = True
+DEBUG = env_flag('FLASK_DEBUG', str(_debug))
 
 # Connect to the database
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://postgres:1@localhost:5432/fyyur')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+# Logging every statement is synchronous and slow; opt in when debugging.
+SQLALCHEMY_ECHO = env_flag('SQLALCHEMY_ECHO', 'false')
 
+# Connection pool, per process. Each gunicorn worker holds up to
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections; keep workers x that below
+# max_connections. Behind PgBouncer set DB_NULLPOOL=1 so connections are
+# opened per checkout and pooled by PgBouncer instead (its transaction mode
+# drops startup options, so set statement_timeout on the role there).
+DB_NULLPOOL = env_flag('DB_NULLPOOL', 'false')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', _pool_size))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', _max_overflow))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', _recycle))
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', _statement_timeout))
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://postgres:1@localhost:5432/fyyur'
-SQLALCHEMY_TRACK_MODIFICATIONS = False
-SQLALCHEMY_ECHO = True
\ No newline at end of file
+def engine_options(uri):
+    # Pre-ping replaces connections the server or a load balancer closed
+    # while idle, so the first request after a quiet spell doesn't fail.
+    options = {'pool_pre_ping': True}
+    if DB_NULLPOOL:
+        options['poolclass'] = NullPool
+    elif not uri.startswith('sqlite'):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_use_lifo=True,
+        )
+    if uri.startswith('postgresql') and DB_STATEMENT_TIMEOUT and not DB_NULLPOOL:
+        options['connect_args'] = {'options': '-c statement_timeout={}'.format(DB_STATEMENT_TIMEOUT)}
+    return options
+
+SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+
+# Async copies of the read-only pages under /async (see async_pages.py).
+# asgi.py turns them on.
+ASYNC_PAGES = env_flag('ASYNC_PAGES', 'false')
+
+# Per-request SQL profiling (see profiling.py): Server-Timing headers and a
+# JSON slow-request log.
+SQL_PROFILING = env_flag('SQL_PROFILING', 'false')
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+SLOW_STATEMENTS = int(os.environ.get('SLOW_STATEMENTS', 5))
+
+# Search backend for /venues/search and /artists/search:
+# 'trigram' (pg_trgm), 'fulltext' (to_tsvector) or 'memory'.
+# Non-PostgreSQL databases always use the in-memory index.
+SEARCH_BACKEND = 'trigram'
+SEARCH_LIMIT = 50
+
+# Name autocomplete for /api/autocomplete (see autocomplete.py). The index
+# is loaded on the first request, picks up new rows from other processes
+# every AUTOCOMPLETE_REFRESH seconds and is rebuilt once it is older than
+# AUTOCOMPLETE_MAX_AGE seconds.
+AUTOCOMPLETE_PRELOAD = env_flag('AUTOCOMPLETE_PRELOAD', 'true')
+AUTOCOMPLETE_REFRESH = int(os.environ.get('AUTOCOMPLETE_REFRESH', 5))
+AUTOCOMPLETE_MAX_AGE = int(os.environ.get('AUTOCOMPLETE_MAX_AGE', 3600))
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+# Rendered page cache (see cache.py): 'lru', 'redis' or 'null'.
+CACHE_TYPE = 'lru'
+CACHE_LRU_SIZE = 1024
+CACHE_REDIS_URL = 'redis://localhost:6379/0'
+# Pages also expire so shows move from upcoming to past as time passes.
+CACHE_DEFAULT_TIMEOUT = 300
+
+# Rendered show tiles, cached within pages (see fragments.py); 0 disables.
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 4096))
+
+# Errors and slow requests, as JSON lines. Relative to the instance folder;
+# empty logs to stderr, as debug mode always does.
+LOG_FILE = os.environ.get('LOG_FILE', 'error.log')
+
+# Compiled templates, shared by the workers and filled at build time with
+# `flask precompile-templates` (see template_cache.py). Relative to the
+# instance folder; empty disables, the default outside production.
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', 'jinja_cache' if ENV == 'production' else '')
+
+# Fingerprinted and precompressed static files, written by
+# `flask build-assets` and served under /assets (see assets.py).
+ASSETS_DIR = os.environ.get('ASSETS_DIR', os.path.join(basedir, 'build', 'assets'))
+ASSETS_MAX_AGE = 365 * 24 * 3600
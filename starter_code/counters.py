@@ -0,0 +1,159 @@
+from datetime import timezone
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, inspect, select, update
+from models import db, Venue, Artist, Show, CounterState
+import clock
+#----------------------------------------------------------------------------#
+# Denormalized upcoming/past show counters on Venue and Artist.
+#
+# A show counts as upcoming when it starts at or after the watermark
+# CounterState.rolled_at, past otherwise. ORM inserts, deletes and edits of
+# Show rows adjust the counters in the same transaction; the watermark is
+# advanced by a periodic job:
+#
+#   */5 * * * *  flask counters roll-forward
+#
+# which moves the shows that started since the last run from upcoming to
+# past. `flask counters rebuild` recounts everything from the show table,
+# e.g. after bulk loads that bypass the ORM.
+#----------------------------------------------------------------------------#
+
+# model -> Show foreign key column
+OWNERS = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+def as_utc(value):
+    # SQLite hands back naive datetimes; all show times are UTC.
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def utc_isoformat(value):
+    # '2030-01-01T20:00:00+00:00' whatever the database's session time zone.
+    return as_utc(value).astimezone(timezone.utc).isoformat()
+
+def watermark(connection, lock=None):
+    """ The current CounterState.rolled_at. `lock` is 'share' for writers
+    adjusting counters, 'update' for the jobs moving the watermark. """
+    query = select(CounterState.rolled_at).where(CounterState.id == 1)
+    if lock:
+        query = query.with_for_update(read=lock == 'share')
+    return as_utc(connection.execute(query).scalar_one())
+
+def _adjust(connection, venue_id, artist_id, start_time, delta):
+    rolled_at = watermark(connection, lock='share')
+    for model, id in ((Venue, venue_id), (Artist, artist_id)):
+        column = model.upcoming_shows_count if as_utc(start_time) >= rolled_at else model.past_shows_count
+        connection.execute(update(model.__table__).where(model.id == id).values({column.key: column + delta}))
+
+@event.listens_for(Show, 'after_insert')
+def _count_insert(mapper, connection, show):
+    _adjust(connection, show.venue_id, show.artist_id, show.start_time, 1)
+
+@event.listens_for(Show, 'after_delete')
+def _count_delete(mapper, connection, show):
+    _adjust(connection, show.venue_id, show.artist_id, show.start_time, -1)
+
+@event.listens_for(Show, 'after_update')
+def _count_update(mapper, connection, show):
+    state = inspect(show)
+    old = {}
+    for key in ('venue_id', 'artist_id', 'start_time'):
+        history = state.attrs[key].history
+        old[key] = history.deleted[0] if history.deleted else getattr(show, key)
+    if old != {key: getattr(show, key) for key in old}:
+        _adjust(connection, old['venue_id'], old['artist_id'], old['start_time'], -1)
+        _adjust(connection, show.venue_id, show.artist_id, show.start_time, 1)
+
+def roll_forward(now=None):
+    """ Move shows that started since the last run from upcoming to past.
+    Returns the number of shows moved. """
+    now = now or clock.now()
+    connection = db.session.connection()
+    rolled_at = watermark(connection, lock='update')
+    if now <= rolled_at:
+        db.session.rollback()
+        return 0
+    started = (Show.start_time >= rolled_at, Show.start_time < now)
+    moved = connection.execute(select(db.func.count()).where(*started)).scalar_one()
+    for model, fk in OWNERS if moved else ():
+        counts = select(fk.label('id'), db.func.count().label('n')).where(*started).group_by(fk).subquery()
+        table = model.__table__
+        connection.execute(update(table).where(table.c.id == counts.c.id).values(
+            upcoming_shows_count=table.c.upcoming_shows_count - counts.c.n,
+            past_shows_count=table.c.past_shows_count + counts.c.n,
+        ))
+    connection.execute(update(CounterState.__table__).where(CounterState.id == 1).values(rolled_at=now))
+    db.session.commit()
+    return moved
+
+def discount(*criteria, owners=OWNERS):
+    """ Take the shows matching `criteria` off the counters of their venues
+    and artists, or of `owners` only, before a bulk delete that bypasses the
+    ORM events. Runs in the session's transaction; the caller commits. """
+    connection = db.session.connection()
+    rolled_at = watermark(connection, lock='share')
+    for model, fk in owners:
+        counts = select(
+            fk.label('id'),
+            db.func.count().filter(Show.start_time >= rolled_at).label('upcoming'),
+            db.func.count().filter(Show.start_time < rolled_at).label('past'),
+        ).where(*criteria).group_by(fk).subquery()
+        table = model.__table__
+        connection.execute(update(table).where(table.c.id == counts.c.id).values(
+            upcoming_shows_count=table.c.upcoming_shows_count - counts.c.upcoming,
+            past_shows_count=table.c.past_shows_count - counts.c.past,
+        ))
+
+def rebuild(venue_ids=None, artist_ids=None):
+    """ Recount from the show table. With no ids every row is recounted and
+    the watermark moves to now; with ids only those rows are, against the
+    current watermark. """
+    connection = db.session.connection()
+    full = venue_ids is None and artist_ids is None
+    if full:
+        rolled_at = clock.now()
+        watermark(connection, lock='update')
+        connection.execute(update(CounterState.__table__).where(CounterState.id == 1).values(rolled_at=rolled_at))
+    else:
+        rolled_at = watermark(connection, lock='share')
+    for (model, fk), ids in zip(OWNERS, (venue_ids, artist_ids)):
+        if not full and not ids:
+            continue
+        def count(*criteria):
+            return select(db.func.count()).where(fk == model.id, *criteria).scalar_subquery()
+        query = update(model).values(
+            upcoming_shows_count=count(Show.start_time >= rolled_at),
+            past_shows_count=count(Show.start_time < rolled_at),
+        )
+        if ids is not None:
+            query = query.where(model.id.in_(ids))
+        connection.execute(query)
+    db.session.commit()
+
+def evict_pages():
+    # Listings show the counts; detail pages split their shows themselves.
+    page_cache = current_app.extensions.get('page_cache')
+    if page_cache is not None:
+        page_cache.evict_namespace('venues')
+        page_cache.evict_namespace('artists')
+
+@click.group('counters')
+def counters_command():
+    """ Maintain the denormalized upcoming/past show counts. """
+
+@counters_command.command('roll-forward')
+@with_appcontext
+def roll_forward_command():
+    """ Move shows that have started since the last run to past. """
+    moved = roll_forward()
+    if moved:
+        evict_pages()
+    click.echo('Moved {} shows from upcoming to past.'.format(moved))
+
+@counters_command.command('rebuild')
+@with_appcontext
+def rebuild_command():
+    """ Recount every venue and artist from the show table. """
+    rebuild()
+    evict_pages()
+    click.echo('Rebuilt show counters.')
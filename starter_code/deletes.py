@@ -0,0 +1,62 @@
+from flask import current_app
+from sqlalchemy import delete, select
+from models import db, Venue, Artist, Show
+import counters
+import search
+#----------------------------------------------------------------------------#
+# Bulk deletes of venues and artists.
+#
+# The database deletes their shows and genre links through the ON DELETE
+# CASCADE foreign keys, so nothing is loaded into the session: each chunk of
+# ids costs a counter UPDATE for the other side of their shows and one
+# DELETE, however many shows they have. All chunks commit together.
+#----------------------------------------------------------------------------#
+
+# Ids per statement, keeping IN lists well under the bind parameter limits.
+CHUNK = 1000
+
+# model -> (its Show foreign key, the model on the other side of its shows)
+SIDES = {
+    Venue: (Show.venue_id, Artist),
+    Artist: (Show.artist_id, Venue),
+}
+
+def delete_owners(model, ids):
+    """ Delete the venues or artists with these ids along with their shows.
+    Returns the ids that existed and were deleted. """
+    fk, other = SIDES[model]
+    other_fk = SIDES[other][0]
+    ids = sorted(set(ids))
+    deleted = []
+    affected = set()
+    try:
+        for start in range(0, len(ids), CHUNK):
+            chunk = ids[start:start + CHUNK]
+            affected.update(db.session.scalars(select(other_fk).where(fk.in_(chunk)).distinct()))
+            # The deleted rows' own counters go with them.
+            counters.discount(fk.in_(chunk), owners=[(other, other_fk)])
+            deleted += db.session.scalars(
+                delete(model).where(model.id.in_(chunk)).returning(model.id),
+                execution_options={'synchronize_session': False})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if deleted:
+        forget(model, deleted, other, affected)
+    return deleted
+
+def forget(model, ids, other, other_ids):
+    search.forget(model, ids)
+    autocomplete = current_app.extensions.get('autocomplete')
+    if autocomplete is not None:
+        autocomplete.forget(model, ids)
+    page_cache = current_app.extensions.get('page_cache')
+    if page_cache is None:
+        return
+    page_cache.evict(*['{}:{}'.format(model.__name__.lower(), id) for id in ids])
+    page_cache.evict(*['{}:{}'.format(other.__name__.lower(), id) for id in other_ids])
+    # Both listings show counters, and /shows lists the deleted shows.
+    page_cache.evict_namespace('venues')
+    page_cache.evict_namespace('artists')
+    page_cache.evict_namespace('shows')
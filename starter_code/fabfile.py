@@ -6,13 +6,30 @@ from fabric.contrib.console import confirm
 
 def test():
     with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
-    if result.failed and not confirm("Tests failed. Continue?"):
+        results = [local("python bench/{}.py".format(check), capture=True)
+                   for check in ("query_budget", "frozen_clock")]
+    if any(result.failed for result in results) and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
 
+def bench(shows="1k", output="bench-results.json", compare=None):
+    # fab bench:shows=100k,output=after.json,compare=before.json
+    command = "python bench/routes.py --shows {} --output {}".format(shows, output)
+    if compare:
+        command += " --compare {}".format(compare)
+    local(command)
+
+
+def precompile():
+    # Fill the compiled template cache before the workers start.
+    local("flask --app app precompile-templates")
+
+
+def build_assets():
+    # Fingerprint and precompress static/ for the /assets URLs.
+    local("flask --app app build-assets")
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -39,9 +56,7 @@ def heroku():
 
 
 def heroku_test():
-    local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
-    )
+    local("heroku run python bench/query_budget.py")
 
 
 def deploy():
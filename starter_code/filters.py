@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+#----------------------------------------------------------------------------#
+# Jinja filters.
+#
+# babel.dates and dateutil are imported, and the locale data loaded, on the
+# first call rather than at app startup.
+#----------------------------------------------------------------------------#
+
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+def format_datetime(value, format='medium'):
+    # Show tiles repeat the same start times, so formatted strings are memoized.
+    # The same instant in two timezones compares (and hashes) equal but is
+    # formatted differently, so the offset is part of the key.
+    offset = value.utcoffset() if isinstance(value, datetime) else None
+    try:
+        return _format_datetime(value, offset, format)
+    except TypeError:
+        # Unhashable value: format it without the memo.
+        return _format_datetime.__wrapped__(value, offset, format)
+
+@lru_cache(maxsize=4096)
+def _format_datetime(value, offset, format):
+    # Native datetimes skip the parser.
+    if isinstance(value, datetime):
+        date = value
+    else:
+        import dateutil.parser
+        date = dateutil.parser.parse(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return pattern(format).apply(date, locale())
+
+@lru_cache(maxsize=None)
+def locale():
+    from babel import Locale
+    return Locale.parse('en')
+
+@lru_cache(maxsize=64)
+def pattern(format):
+    # Compiled once per format instead of on every call.
+    from babel.dates import parse_pattern
+    return parse_pattern(FORMATS.get(format, format))
@@ -1,8 +1,9 @@
-from datetime import datetime
+from datetime import timedelta, timezone
 from flask_wtf import FlaskForm
 from enums import Genre, State
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+import clock
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, ValidationError, NumberRange
 import re
 
 def is_valid_phone(number):
@@ -32,8 +33,22 @@ class ShowForm(FlaskForm):
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
-        default= datetime.today()
+        # Read on each form, not once at import; naive UTC like the stored times.
+        default=lambda: clock.now().replace(tzinfo=None)
     )
+    # Minutes; up to models.MAX_SHOW_DURATION.
+    duration = IntegerField(
+        'duration', validators=[NumberRange(min=1, max=24 * 60)],
+        default=120
+    )
+
+def start_time_column(form):
+    # The form's time is naive and means UTC; stored timestamptz values need
+    # the zone, or PostgreSQL reads them in the session's TimeZone.
+    return form.start_time.data.replace(tzinfo=timezone.utc)
+
+def end_time_column(form):
+    return start_time_column(form) + timedelta(minutes=form.duration.data)
 
 class VenueForm(FlaskForm):
     name = StringField(
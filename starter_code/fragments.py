@@ -0,0 +1,84 @@
+import inspect
+import threading
+from jinja2 import nodes
+from jinja2.ext import Extension
+from cache import LRUCache, NullCache
+#----------------------------------------------------------------------------#
+# Template fragment cache.
+#
+#   {% cache 'show-tile', show.venue_id, show.artist_id, show.start_time,
+#            show.version, show.venue_version, show.artist_version %}
+#     ...
+#   {% endcache %}
+#
+# The block is rendered once per distinct key and then served from an
+# in-process LRU, whether or not the page around it is cached. Keys start
+# with the fragment's name and carry the version_id of every row the
+# fragment shows: editing a show, venue or artist bumps its version, the
+# key changes and the old fragment ages out of the LRU.
+#
+# Config:
+#   FRAGMENT_CACHE_SIZE   fragments kept; 0 turns the cache off
+#----------------------------------------------------------------------------#
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        key = nodes.Tuple(parts, 'load')
+        return nodes.CallBlock(self.call_method('_fragment', [key]), [], [], body).set_lineno(lineno)
+
+    def _fragment(self, key, caller):
+        return self.environment.fragment_cache.fragment(key, caller)
+
+class FragmentCache:
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        size = app.config.get('FRAGMENT_CACHE_SIZE', 4096)
+        self.backend = LRUCache(size) if size else NullCache()
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.extend(fragment_cache=self)
+        app.extensions['fragment_cache'] = self
+
+    def fragment(self, key, render):
+        fragment = self.backend.get(key)
+        if fragment is not None:
+            self._count('hits')
+            return fragment
+        self._count('misses')
+        fragment = render()
+        if inspect.isawaitable(fragment):
+            # Templates rendered in Jinja's async mode.
+            return self._store_async(key, fragment)
+        self.backend.set(key, fragment)
+        return fragment
+
+    async def _store_async(self, key, rendering):
+        fragment = await rendering
+        self.backend.set(key, fragment)
+        return fragment
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.backend) if isinstance(self.backend, LRUCache) else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else None,
+        }
@@ -0,0 +1,299 @@
+import csv
+import io
+import json
+import time
+from datetime import timezone
+import click
+import dateutil.parser
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import insert, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.datastructures import MultiDict
+import enums
+from forms import VenueForm, ArtistForm, ShowForm, start_time_column, end_time_column
+from models import db, Venue, Artist, Show, Genre, venue_genre, artist_genre
+import search
+import counters
+from scheduling import Bookings
+#----------------------------------------------------------------------------#
+# Bulk import of venues, artists and shows.
+#
+#   flask import venues venues.csv
+#   flask import shows shows.jsonl --batch-size 10000 --rejects rejected.jsonl
+#
+# Rows are validated with the same WTForms rules as the create forms, then
+# written in batches: executemany, or COPY on PostgreSQL with --copy. Venue
+# and artist rows are inserted with RETURNING so their genre links can be
+# written in the same batch. Shows overlapping a show already booked, or an
+# earlier row, for their venue or artist are rejected (see scheduling.py);
+# shows already listed are skipped and counted apart.
+#----------------------------------------------------------------------------#
+
+# Column names accepted in place of the form field names.
+ALIASES = {'website': 'website_link'}
+BOOLEAN_FIELDS = {'seeking_talent', 'seeking_venue'}
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y', 'on'}
+# Genres may be given by display value ('Hip-Hop') or by name ('HipHop').
+GENRE_NAMES = {genre.value: genre.name for genre in enums.Genre}
+
+def genres_column(form):
+    return form.genres.data
+
+# kind -> (model, form, {model column: form field name or callable(form)})
+KINDS = {
+    'venues': (Venue, VenueForm, {
+        'name': 'name', 'city': 'city', 'state': 'state', 'address': 'address', 'phone': 'phone',
+        'genres': genres_column, 'image_link': 'image_link', 'facebook_link': 'facebook_link',
+        'website': 'website_link', 'seeking_talent': 'seeking_talent',
+        'seeking_description': 'seeking_description',
+    }),
+    'artists': (Artist, ArtistForm, {
+        'name': 'name', 'city': 'city', 'state': 'state', 'phone': 'phone',
+        'genres': genres_column, 'image_link': 'image_link', 'facebook_link': 'facebook_link',
+        'website': 'website_link', 'seeking_venue': 'seeking_venue',
+        'seeking_description': 'seeking_description',
+    }),
+    'shows': (Show, ShowForm, {
+        'artist_id': lambda form: int(form.artist_id.data),
+        'venue_id': lambda form: int(form.venue_id.data),
+        'start_time': start_time_column,
+        'end_time': end_time_column,
+    }),
+}
+
+def read_rows(stream, format):
+    if format == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+def to_formdata(row, fields=()):
+    """ The row as form data; `fields` missing from it, or None in it (a
+    short CSV line), are given as empty strings. """
+    data = MultiDict()
+    for key, value in row.items():
+        key = ALIASES.get(key, key)
+        if value is None:
+            value = ''
+        if key in BOOLEAN_FIELDS:
+            value = 'y' if str(value).strip().lower() in TRUE_VALUES else ''
+        if key == 'genres':
+            values = value.split(',') if isinstance(value, str) else value
+            values = [GENRE_NAMES.get(str(v).strip(), str(v).strip()) for v in values if str(v).strip()]
+        elif key == 'start_time' and value:
+            # ISO 8601 and friends -> the ShowForm's '%Y-%m-%d %H:%M:%S', in UTC.
+            try:
+                parsed = dateutil.parser.parse(str(value))
+            except (ValueError, OverflowError):
+                values = [str(value)]
+            else:
+                if parsed.tzinfo is not None:
+                    parsed = parsed.astimezone(timezone.utc)
+                values = [parsed.strftime('%Y-%m-%d %H:%M:%S')]
+        else:
+            values = [str(value)]
+        for v in values:
+            data.add(key, v)
+    for key in fields:
+        if key not in data:
+            data.add(key, '')
+    return data
+
+def validate(kind, row, known_ids, bookings=None):
+    """ Return (model row, None) or (None, errors). Accepted shows are
+    booked in `bookings`, so later rows overlapping them are rejected. """
+    model, form_class, columns = KINDS[kind]
+    fields = [source for source in columns.values() if isinstance(source, str)]
+    form = form_class(formdata=to_formdata(row, fields), meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+    if kind == 'shows':
+        # A missing start_time would silently fall back to the form default.
+        errors = {} if form.start_time.raw_data else {'start_time': ['This field is required.']}
+        for field, ids in (('artist_id', known_ids['artists']), ('venue_id', known_ids['venues'])):
+            if not form[field].data.isdigit() or int(form[field].data) not in ids:
+                errors[field] = ['Unknown id.']
+        if errors:
+            return None, errors
+    values = {column: (form[source].data if isinstance(source, str) else source(form))
+              for column, source in columns.items()}
+    if bookings is not None:
+        conflict = bookings.book(values['venue_id'], values['artist_id'], values['start_time'], values['end_time'])
+        if conflict:
+            return None, {'start_time': ['The {} is already booked at this time.'.format(conflict)]}
+    return values, None
+
+# model -> (association table, foreign key column name)
+GENRE_LINKS = {Venue: (venue_genre, 'venue_id'), Artist: (artist_genre, 'artist_id')}
+
+class BatchWriter:
+    def __init__(self, model, batch_size, use_copy):
+        self.model = model
+        self.batch_size = batch_size
+        self.dialect = db.engine.dialect.name
+        self.use_copy = use_copy and self.dialect == 'postgresql'
+        self.rows = []
+        self.written = 0
+        # Shows already listed, dropped by ON CONFLICT DO NOTHING.
+        self.skipped = 0
+        if model in GENRE_LINKS:
+            self.genre_ids = dict(db.session.execute(select(Genre.name, Genre.id)).all())
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.model in GENRE_LINKS:
+            inserted = self._write_with_genres()
+        elif self.use_copy and self.model is Show:
+            inserted = self._copy_shows()
+        elif self.use_copy:
+            self._copy(self.model.__tablename__, self.rows)
+            inserted = len(self.rows)
+        else:
+            inserted = self._insert()
+        db.session.commit()
+        self.written += inserted
+        self.skipped += len(self.rows) - inserted
+        self.rows = []
+
+    def _insert(self):
+        if self.model is Show and self.dialect in ('postgresql', 'sqlite'):
+            # Re-importing a catalog must not fail on shows already listed.
+            # Only the rows actually inserted come back: the rowcount of a
+            # batched executemany on PostgreSQL counts the rows sent.
+            dialect_insert = postgresql.insert if self.dialect == 'postgresql' else sqlite.insert
+            statement = dialect_insert(Show).on_conflict_do_nothing().returning(Show.venue_id)
+            return len(db.session.execute(statement, self.rows).all())
+        return db.session.execute(insert(self.model), self.rows).rowcount
+
+    def _write_with_genres(self):
+        association, fk = GENRE_LINKS[self.model]
+        genres = [row.pop('genres') for row in self.rows]
+        ids = db.session.scalars(
+            insert(self.model).returning(self.model.id, sort_by_parameter_order=True), self.rows
+        ).all()
+        links = [{fk: id, 'genre_id': self.genre_ids[name]}
+                 for id, names in zip(ids, genres) for name in names if name in self.genre_ids]
+        if links and self.use_copy:
+            self._copy(association.name, links)
+        elif links:
+            db.session.execute(insert(association), links)
+        return len(ids)
+
+    def _copy_shows(self):
+        # COPY has no ON CONFLICT: the batch is copied into a temporary
+        # table and moved over, skipping the shows already listed like the
+        # INSERT path does.
+        columns = ', '.join('"{}"'.format(c) for c in self.rows[0])
+        db.session.execute(text(
+            'CREATE TEMPORARY TABLE show_import ON COMMIT DROP AS '
+            'SELECT {} FROM "show" WITH NO DATA'.format(columns)))
+        self._copy('show_import', self.rows)
+        return db.session.execute(text(
+            'INSERT INTO "show" ({0}) SELECT {0} FROM show_import ON CONFLICT DO NOTHING'.format(columns)
+        )).rowcount
+
+    def _copy(self, table, rows):
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['\\N' if row[c] is None else row[c] for c in columns])
+        buffer.seek(0)
+        sql = 'COPY "{}" ({}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'.format(
+            table, ', '.join('"{}"'.format(c) for c in columns))
+        cursor = db.session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(sql, buffer)
+        finally:
+            cursor.close()
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']),
+              help='Input format; defaults to the file extension.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per INSERT/COPY and commit.')
+@click.option('--copy/--no-copy', 'use_copy', default=False, help='Use COPY on PostgreSQL.')
+@click.option('--rejects', type=click.Path(dir_okay=False, writable=True),
+              help='Write rejected rows and their errors to this JSON Lines file.')
+@with_appcontext
+def import_command(kind, path, format, batch_size, use_copy, rejects):
+    """ Bulk-load venues, artists or shows from a CSV or JSON Lines file. """
+    format = format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    model = KINDS[kind][0]
+    known_ids = {}
+    bookings = None
+    if kind == 'shows':
+        known_ids = {
+            'venues': set(db.session.scalars(select(Venue.id))),
+            'artists': set(db.session.scalars(select(Artist.id))),
+        }
+        # Every show already booked, checked against in memory rather than
+        # with a query per row.
+        bookings = Bookings.load()
+
+    writer = BatchWriter(model, batch_size, use_copy)
+    rejected = 0
+    touched = set()
+    started = time.perf_counter()
+    rejects_file = open(rejects, 'w', encoding='utf-8') if rejects else None
+    try:
+        with open(path, newline='', encoding='utf-8') as stream:
+            for line, row in enumerate(read_rows(stream, format), start=1):
+                try:
+                    values, errors = validate(kind, row, known_ids, bookings)
+                except (AttributeError, TypeError, ValueError) as e:
+                    # A row of the wrong shape is rejected, not the whole run.
+                    values, errors = None, {'row': [str(e)]}
+                if errors:
+                    rejected += 1
+                    if rejects_file:
+                        rejects_file.write(json.dumps({'line': line, 'errors': errors, 'row': row}, default=str) + '\n')
+                    elif rejected <= 10:
+                        click.echo('line {}: {}'.format(line, errors), err=True)
+                    continue
+                writer.add(values)
+                if kind == 'shows':
+                    touched.add(('venue', values['venue_id']))
+                    touched.add(('artist', values['artist_id']))
+                if writer.written and not writer.rows:
+                    click.echo('{:>10} rows written ({:,.0f} rows/s)'.format(
+                        writer.written, writer.written / (time.perf_counter() - started)))
+        writer.flush()
+    finally:
+        if rejects_file:
+            rejects_file.close()
+
+    if kind == 'shows' and touched:
+        # Bulk inserts bypass the ORM events that maintain the counters.
+        counters.rebuild(venue_ids={id for owner, id in touched if owner == 'venue'},
+                         artist_ids={id for owner, id in touched if owner == 'artist'})
+    elapsed = time.perf_counter() - started
+    evict_pages(kind, touched)
+    click.echo('Imported {} {} in {:.1f}s ({:,.0f} rows/s), skipped {} already listed, rejected {}.'.format(
+        writer.written, kind, elapsed, writer.written / elapsed if elapsed else 0, writer.skipped, rejected))
+
+def evict_pages(kind, touched):
+    page_cache = current_app.extensions.get('page_cache')
+    if kind in ('venues', 'artists'):
+        search.invalidate(KINDS[kind][0])
+        autocomplete = current_app.extensions.get('autocomplete')
+        if autocomplete is not None:
+            autocomplete.invalidate(KINDS[kind][0])
+    if page_cache is None:
+        return
+    if kind == 'shows':
+        page_cache.evict(*('{}:{}'.format(*key) for key in touched))
+        page_cache.evict_namespace('venues')
+        page_cache.evict_namespace('shows')
+    else:
+        page_cache.evict_namespace(kind)
@@ -0,0 +1,214 @@
+import base64
+import json
+from bisect import bisect_left
+from datetime import datetime
+from models import db, Venue, Artist, Show, Genre, venue_genre, artist_genre
+from counters import as_utc
+#----------------------------------------------------------------------------#
+# Listing helpers shared by the views in app.py and the async views in
+# async_pages.py: statement builders, which the caller executes on its own
+# session, and the shaping of their rows for the templates.
+#----------------------------------------------------------------------------#
+
+SHOWS_PER_PAGE = 30
+SHOWS_MAX_PER_PAGE = 100
+
+def encode_cursor(*values):
+    # Opaque, URL-safe token holding the sort key of the last row on a page.
+    raw = json.dumps(
+        [v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(',', ':')
+    ).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, size=3):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor')
+    return values
+
+def is_id(value):
+    # JSON true/false decode to bools, which are ints too.
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def parse_cursor(cursor):
+    """ The (start_time, venue_id, artist_id) key of a /shows cursor. """
+    try:
+        start_time, venue_id, artist_id = decode_cursor(cursor)
+        start_time = datetime.fromisoformat(start_time)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not (is_id(venue_id) and is_id(artist_id)):
+        raise ValueError('Invalid cursor')
+    return start_time, venue_id, artist_id
+
+def shows_query(after=None, per_page=SHOWS_PER_PAGE):
+    # Pages are keyed on (start_time, venue_id, artist_id) rather than OFFSET,
+    # so fetching a deep page costs the same as fetching the first one.
+    query = db.select(
+        Show.start_time, Show.venue_id, Show.artist_id,
+        Venue.name.label('venue_name'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        # Fragment cache keys of the show tiles.
+        Show.version_id.label('version'),
+        Venue.version_id.label('venue_version'),
+        Artist.version_id.label('artist_version')
+    ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id)
+    if after:
+        query = query.where(
+            db.tuple_(Show.start_time, Show.venue_id, Show.artist_id) > db.tuple_(*after)
+        )
+    # Fetch one extra row to know whether there is a next page.
+    return query.order_by(Show.start_time, Show.venue_id, Show.artist_id).limit(per_page + 1)
+
+def listing_filters(model, association, fk, genre=None, state=None):
+    filters = []
+    if genre:
+        filters.append(model.id.in_(
+            db.select(fk).join(Genre, Genre.id == association.c.genre_id).where(Genre.name == genre)
+        ))
+    if state:
+        filters.append(model.state == state)
+    return filters
+
+def facet_query(model, association, fk, genre=None, state=None):
+    # Genre and state facet counts from one UNION ALL aggregate. Each facet
+    # is narrowed by the other facet's selection, so every count is the
+    # number of results that clicking it would give.
+    genre_counts = db.select(
+        db.literal_column("'genre'").label('facet'), Genre.name.label('value'),
+        Genre.label.label('label'), db.func.count().label('count')
+    ).select_from(association).join(Genre, Genre.id == association.c.genre_id)
+    if state:
+        genre_counts = genre_counts.join(model, model.id == fk).where(model.state == state)
+    genre_counts = genre_counts.group_by(Genre.name, Genre.label)
+    state_counts = db.select(
+        db.literal_column("'state'"), model.state, model.state, db.func.count()
+    ).where(*listing_filters(model, association, fk, genre=genre)).group_by(model.state)
+    return db.union_all(genre_counts, state_counts)
+
+def group_facets(rows):
+    facets = {'genre': [], 'state': []}
+    for row in rows:
+        facets[row.facet].append({'value': row.value, 'label': row.label, 'count': row.count})
+    facets['genre'].sort(key=lambda facet: (-facet['count'], facet['label']))
+    facets['state'].sort(key=lambda facet: facet['value'] or '')
+    return facets
+
+def venues_query(genre=None, state=None):
+    # Venues with their upcoming show counter (see counters.py), by area.
+    return db.select(
+        Venue.id, Venue.name, Venue.city, Venue.state,
+        Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).where(
+        *listing_filters(Venue, venue_genre, venue_genre.c.venue_id, genre, state)
+    ).order_by(Venue.state, Venue.city, Venue.name)
+
+def artists_query(genre=None, state=None):
+    return db.select(Artist.id, Artist.name).where(
+        *listing_filters(Artist, artist_genre, artist_genre.c.artist_id, genre, state)
+    ).order_by(Artist.id)
+
+def group_areas(rows):
+    # (id, name, city, state, num_upcoming_shows) rows ordered by state and
+    # city -> the /venues areas.
+    areas = {}
+    for row in rows:
+        area = areas.get((row.city, row.state))
+        if area is None:
+            area = areas[(row.city, row.state)] = {
+                'city': row.city,
+                'state': row.state,
+                'venues': []
+            }
+        area['venues'].append({
+            'id': row.id,
+            'name': row.name,
+            'num_upcoming_shows': row.num_upcoming_shows
+        })
+    return list(areas.values())
+
+VENUE_FIELDS = ('id', 'name', 'address', 'city', 'state', 'phone', 'website', 'facebook_link',
+                'seeking_talent', 'seeking_description', 'image_link')
+ARTIST_FIELDS = ('id', 'name', 'city', 'state', 'phone', 'website', 'facebook_link',
+                 'seeking_venue', 'seeking_description', 'image_link')
+
+def details(owner):
+    # Template data of a venue or artist loaded with its genres.
+    fields = VENUE_FIELDS if isinstance(owner, Venue) else ARTIST_FIELDS
+    data = {field: getattr(owner, field) for field in fields}
+    data['genres'] = [genre.label for genre in owner.genres]
+    return data
+
+# owner model -> (its Show foreign key, the other side, the other side's
+# Show foreign key, the other side's key prefix in the templates)
+DETAIL_SIDES = {
+    Venue: (Show.venue_id, Artist, Show.artist_id, 'artist'),
+    Artist: (Show.artist_id, Venue, Show.venue_id, 'venue'),
+}
+
+def detail_shows_query(model, id, now, upcoming=None):
+    """ Shows of a venue or artist with the other side's name and image
+    attached. `upcoming` None returns all of them in start order, for
+    split_shows; True/False returns one half, nearest first. """
+    fk, other, other_fk, prefix = DETAIL_SIDES[model]
+    query = db.select(
+        other_fk.label(prefix + '_id'), Show.start_time,
+        other.name.label(prefix + '_name'), other.image_link.label(prefix + '_image_link'),
+        Show.version_id.label('version'), other.version_id.label(prefix + '_version')
+    ).join(other, other.id == other_fk).where(fk == id)
+    if upcoming is None:
+        return query.order_by(Show.start_time)
+    if upcoming:
+        return query.where(Show.start_time >= now).order_by(Show.start_time)
+    return query.where(Show.start_time < now).order_by(Show.start_time.desc())
+
+def split_shows(rows, now):
+    """ Past shows, most recent first, and upcoming shows of rows in start
+    order. A show starting exactly at `now` is upcoming, as in the
+    counters. """
+    split = bisect_left(rows, now, key=lambda row: as_utc(row.start_time))
+    return rows[split - 1::-1] if split else [], rows[split:]
+
+def add_shows(data, model, past_rows, upcoming_rows):
+    other = DETAIL_SIDES[model][3]
+    data['past_shows'] = [show_entry(row, other) for row in past_rows]
+    data['upcoming_shows'] = [show_entry(row, other) for row in upcoming_rows]
+    data['past_shows_count'] = len(data['past_shows'])
+    data['upcoming_shows_count'] = len(data['upcoming_shows'])
+    return data
+
+def show_entry(row, other):
+    # A show on a detail page; `other` is the side it links to, 'artist' on
+    # venue pages and 'venue' on artist pages.
+    return {
+        other + '_id': getattr(row, other + '_id'),
+        other + '_name': getattr(row, other + '_name'),
+        other + '_image_link': getattr(row, other + '_image_link'),
+        other + '_version': getattr(row, other + '_version'),
+        'version': row.version,
+        'start_time': row.start_time
+    }
+
+def shows_page(rows, per_page):
+    # Rows fetched with LIMIT per_page + 1 -> (page, cursor of the next one).
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.start_time, last.venue_id, last.artist_id)
+    return [{
+        "venue_id": row.venue_id,
+        "venue_name": row.venue_name,
+        "artist_id": row.artist_id,
+        "artist_name": row.artist_name,
+        "artist_image_link": row.artist_image_link,
+        "start_time": row.start_time,
+        "version": row.version,
+        "venue_version": row.venue_version,
+        "artist_version": row.artist_version
+    } for row in rows], next_cursor
@@ -0,0 +1,32 @@
+"""row version columns for the API's ETags
+
+Revision ID: 0c6d1e9f4a27
+Revises: f5c2d9e7a1b4
+Create Date: 2026-10-19 00:41:09.318224
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0c6d1e9f4a27'
+down_revision = 'f5c2d9e7a1b4'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ('Venue', 'Artist', 'show')
+
+
+def upgrade():
+    # A constant default: no table rewrite on PostgreSQL 11+.
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('version_id', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('version_id')
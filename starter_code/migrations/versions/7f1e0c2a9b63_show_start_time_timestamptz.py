@@ -0,0 +1,92 @@
+"""show start_time as timestamptz
+
+Revision ID: 7f1e0c2a9b63
+Revises: 3a7c91e5b2d4
+Create Date: 2026-10-18 17:02:45.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import dateutil.parser
+from datetime import timezone
+
+
+# revision identifiers, used by Alembic.
+revision = '7f1e0c2a9b63'
+down_revision = '3a7c91e5b2d4'
+branch_labels = None
+depends_on = None
+
+
+show = sa.table(
+    'show',
+    sa.column('artist_id', sa.Integer),
+    sa.column('venue_id', sa.Integer),
+    sa.column('start_time', sa.String),
+)
+
+
+def utc_text(value):
+    # Strings with an offset are converted to UTC before the offset is
+    # dropped, as ::timestamptz does; naive ones are taken as UTC.
+    parsed = dateutil.parser.parse(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.alter_column(
+            'show', 'start_time',
+            existing_type=sa.String(length=120),
+            type_=sa.DateTime(timezone=True),
+            existing_nullable=False,
+            postgresql_using='start_time::timestamptz',
+        )
+    else:
+        # Other backends keep datetimes as text, and the batch copy would CAST
+        # the old strings away: rewrite them in the layout DateTime reads back.
+        rows = [
+            dict(row._mapping, start_time=utc_text(row.start_time))
+            for row in bind.execute(sa.select(show))
+        ]
+        with op.batch_alter_table('show', schema=None) as batch_op:
+            batch_op.alter_column(
+                'start_time',
+                existing_type=sa.String(length=120),
+                type_=sa.DateTime(timezone=True),
+                existing_nullable=False,
+            )
+        bind.execute(show.delete())
+        if rows:
+            bind.execute(show.insert(), rows)
+
+    with op.batch_alter_table('show', schema=None) as batch_op:
+        batch_op.create_index('ix_show_venue_id_start_time', ['venue_id', 'start_time'], unique=False)
+        batch_op.create_index('ix_show_artist_id_start_time', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('show', schema=None) as batch_op:
+        batch_op.drop_index('ix_show_artist_id_start_time')
+        batch_op.drop_index('ix_show_venue_id_start_time')
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.alter_column(
+            'show', 'start_time',
+            existing_type=sa.DateTime(timezone=True),
+            type_=sa.String(length=120),
+            existing_nullable=False,
+            postgresql_using="to_char(start_time AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS.MS\"Z\"')",
+        )
+    else:
+        with op.batch_alter_table('show', schema=None) as batch_op:
+            batch_op.alter_column(
+                'start_time',
+                existing_type=sa.DateTime(timezone=True),
+                type_=sa.String(length=120),
+                existing_nullable=False,
+            )
@@ -0,0 +1,96 @@
+"""show end_time and double-booking constraints
+
+Revision ID: a3f8e61c0d92
+Revises: e2a6d8c41f07
+Create Date: 2026-10-18 21:05:37.604118
+
+Existing shows get the default two hour duration, cut short where their
+venue or artist has a later show starting before then, so that the
+exclusion constraints hold for data booked before they existed. Shows
+starting at the same time as another show of their venue or artist end up
+empty, which overlaps nothing.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f8e61c0d92'
+down_revision = 'e2a6d8c41f07'
+branch_labels = None
+depends_on = None
+
+
+DEFAULT_DURATION = timedelta(hours=2)
+
+show = sa.table(
+    'show',
+    sa.column('artist_id', sa.Integer),
+    sa.column('venue_id', sa.Integer),
+    sa.column('start_time', sa.DateTime(timezone=True)),
+    sa.column('end_time', sa.DateTime(timezone=True)),
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    with op.batch_alter_table('show', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('end_time', sa.DateTime(timezone=True), nullable=True))
+
+    if bind.dialect.name == 'postgresql':
+        op.execute("""
+            UPDATE show SET end_time = least(
+                show.start_time + interval '2 hours', next.venue_start, next.artist_start)
+            FROM (
+                SELECT venue_id, artist_id, start_time,
+                       lead(start_time) OVER (PARTITION BY venue_id ORDER BY start_time, artist_id) AS venue_start,
+                       lead(start_time) OVER (PARTITION BY artist_id ORDER BY start_time, venue_id) AS artist_start
+                FROM show
+            ) AS next
+            WHERE (show.venue_id, show.artist_id, show.start_time)
+                = (next.venue_id, next.artist_id, next.start_time)
+        """)
+    else:
+        rows = bind.execute(sa.select(show.c.venue_id, show.c.artist_id, show.c.start_time)).all()
+        end_times = {row: row.start_time + DEFAULT_DURATION for row in rows}
+        for side in ('venue_id', 'artist_id'):
+            shows = defaultdict(list)
+            for row in rows:
+                shows[getattr(row, side)].append(row)
+            for owner_shows in shows.values():
+                owner_shows.sort(key=lambda row: (row.start_time, row.artist_id, row.venue_id))
+                for row, later in zip(owner_shows, owner_shows[1:]):
+                    end_times[row] = min(end_times[row], later.start_time)
+        if rows:
+            key = sa.and_(
+                show.c.venue_id == sa.bindparam('b_venue_id'),
+                show.c.artist_id == sa.bindparam('b_artist_id'),
+                show.c.start_time == sa.bindparam('b_start_time'),
+            )
+            bind.execute(show.update().where(key).values(end_time=sa.bindparam('b_end_time')), [
+                {'b_venue_id': row.venue_id, 'b_artist_id': row.artist_id,
+                 'b_start_time': row.start_time, 'b_end_time': end_time}
+                for row, end_time in end_times.items()
+            ])
+
+    with op.batch_alter_table('show', schema=None) as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(timezone=True), nullable=False)
+        batch_op.create_check_constraint('ck_show_end_time', 'end_time >= start_time')
+
+    if bind.dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        for name, column in (('ex_show_venue_overlap', 'venue_id'), ('ex_show_artist_overlap', 'artist_id')):
+            op.execute(
+                'ALTER TABLE show ADD CONSTRAINT {} EXCLUDE USING gist '
+                '({} WITH =, tstzrange(start_time, end_time) WITH &&)'.format(name, column))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_constraint('ex_show_artist_overlap', 'show')
+        op.drop_constraint('ex_show_venue_overlap', 'show')
+    with op.batch_alter_table('show', schema=None) as batch_op:
+        batch_op.drop_constraint('ck_show_end_time', type_='check')
+        batch_op.drop_column('end_time')
@@ -0,0 +1,44 @@
+"""name search indexes
+
+Revision ID: b58e3d0f6c17
+Revises: 7f1e0c2a9b63
+Create Date: 2026-10-18 17:40:03.562190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b58e3d0f6c17'
+down_revision = '7f1e0c2a9b63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Trigram and full-text GIN indexes backing search.py; other databases
+    # fall back to the in-memory index and need nothing here.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('Venue', 'Artist'):
+        name = table.lower()
+        op.create_index(
+            'ix_{}_name_trgm'.format(name), table, ['name'],
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'},
+        )
+        op.create_index(
+            'ix_{}_name_tsv'.format(name), table,
+            [sa.text("to_tsvector('simple', coalesce(name, ''))")],
+            postgresql_using='gin',
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('Venue', 'Artist'):
+        name = table.lower()
+        op.drop_index('ix_{}_name_tsv'.format(name), table_name=table)
+        op.drop_index('ix_{}_name_trgm'.format(name), table_name=table)
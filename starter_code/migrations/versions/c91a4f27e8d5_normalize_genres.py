@@ -0,0 +1,95 @@
+"""normalize genres
+
+Revision ID: c91a4f27e8d5
+Revises: b58e3d0f6c17
+Create Date: 2026-10-18 18:52:37.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import enums
+
+
+# revision identifiers, used by Alembic.
+revision = 'c91a4f27e8d5'
+down_revision = 'b58e3d0f6c17'
+branch_labels = None
+depends_on = None
+
+
+# (owner table, association table, foreign key column)
+LINKS = (
+    ('Venue', 'venue_genre', 'venue_id'),
+    ('Artist', 'artist_genre', 'artist_id'),
+)
+
+
+def upgrade():
+    genre = op.create_table('genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('label', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.bulk_insert(genre, [{'name': g.name, 'label': g.value} for g in enums.Genre])
+
+    for owner, association, fk in LINKS:
+        op.create_table(association,
+        sa.Column(fk, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([fk], ['{}.id'.format(owner)], ),
+        sa.ForeignKeyConstraint(['genre_id'], ['genre.id'], ),
+        sa.PrimaryKeyConstraint(fk, 'genre_id')
+        )
+        with op.batch_alter_table(association, schema=None) as batch_op:
+            batch_op.create_index('ix_{}_genre_id_{}'.format(association, fk), ['genre_id', fk], unique=False)
+
+    # Split the comma-joined strings into links. Tokens were written as enum
+    # names by the forms; display values and unknown genres are accepted too.
+    bind = op.get_bind()
+    genre_ids = {}
+    for id, name, label in bind.execute(sa.text('SELECT id, name, label FROM genre')):
+        genre_ids[name] = genre_ids[label] = id
+    for owner, association, fk in LINKS:
+        links = set()
+        rows = bind.execute(sa.text('SELECT id, genres FROM "{}" WHERE genres IS NOT NULL'.format(owner)))
+        for id, genres in rows.all():
+            for token in (t.strip() for t in genres.split(',')):
+                if not token:
+                    continue
+                if token not in genre_ids:
+                    genre_ids[token] = bind.execute(
+                        genre.insert().values(name=token[:50], label=token[:50]).returning(genre.c.id)
+                    ).scalar_one()
+                links.add((id, genre_ids[token]))
+        if links:
+            op.bulk_insert(
+                sa.table(association, sa.column(fk, sa.Integer), sa.column('genre_id', sa.Integer)),
+                [{fk: id, 'genre_id': genre_id} for id, genre_id in sorted(links)]
+            )
+        with op.batch_alter_table(owner, schema=None) as batch_op:
+            batch_op.drop_column('genres')
+
+
+def downgrade():
+    bind = op.get_bind()
+    for owner, association, fk in LINKS:
+        with op.batch_alter_table(owner, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('genres', sa.String(length=120), nullable=True))
+        joined = {}
+        rows = bind.execute(sa.text(
+            'SELECT a.{fk}, g.name FROM {association} a JOIN genre g ON g.id = a.genre_id '
+            'ORDER BY a.{fk}, g.id'.format(fk=fk, association=association)))
+        for id, name in rows:
+            joined.setdefault(id, []).append(name)
+        for id, names in joined.items():
+            bind.execute(
+                sa.text('UPDATE "{}" SET genres = :genres WHERE id = :id'.format(owner)),
+                {'genres': ', '.join(names)[:120], 'id': id}
+            )
+        with op.batch_alter_table(association, schema=None) as batch_op:
+            batch_op.drop_index('ix_{}_genre_id_{}'.format(association, fk))
+        op.drop_table(association)
+    op.drop_table('genre')
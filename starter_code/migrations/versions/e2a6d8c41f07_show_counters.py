@@ -0,0 +1,56 @@
+"""show counters
+
+Revision ID: e2a6d8c41f07
+Revises: c91a4f27e8d5
+Create Date: 2026-10-18 19:40:12.318204
+
+"""
+from datetime import datetime, timezone
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a6d8c41f07'
+down_revision = 'c91a4f27e8d5'
+branch_labels = None
+depends_on = None
+
+
+# (owner table, Show foreign key column)
+OWNERS = (('Venue', 'venue_id'), ('Artist', 'artist_id'))
+
+
+def upgrade():
+    counter_state = op.create_table('counter_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    rolled_at = datetime.now(timezone.utc)
+    op.bulk_insert(counter_state, [{'id': 1, 'rolled_at': rolled_at}])
+
+    for owner, fk in OWNERS:
+        with op.batch_alter_table(owner, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+            batch_op.add_column(sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+
+        # Initial counts against the watermark, served by the show (fk, start_time) indexes.
+        owner_table = sa.table(owner, sa.column('id'), sa.column('upcoming_shows_count'), sa.column('past_shows_count'))
+        show = sa.table('show', sa.column(fk), sa.column('start_time', sa.DateTime(timezone=True)))
+
+        def count(*criteria):
+            return sa.select(sa.func.count()).where(show.c[fk] == owner_table.c.id, *criteria).scalar_subquery()
+        op.execute(owner_table.update().values(
+            upcoming_shows_count=count(show.c.start_time >= rolled_at),
+            past_shows_count=count(show.c.start_time < rolled_at),
+        ))
+
+
+def downgrade():
+    for owner, fk in OWNERS:
+        with op.batch_alter_table(owner, schema=None) as batch_op:
+            batch_op.drop_column('past_shows_count')
+            batch_op.drop_column('upcoming_shows_count')
+
+    op.drop_table('counter_state')
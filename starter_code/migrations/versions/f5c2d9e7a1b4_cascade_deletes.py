@@ -0,0 +1,49 @@
+"""delete shows and genre links with their venue or artist
+
+Revision ID: f5c2d9e7a1b4
+Revises: a3f8e61c0d92
+Create Date: 2026-10-18 23:12:48.215730
+
+Recreates the foreign keys to Venue and Artist with ON DELETE CASCADE. They
+were created unnamed: PostgreSQL named them <table>_<column>_fkey, and on
+SQLite the batch naming convention gives them a name to drop them by.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5c2d9e7a1b4'
+down_revision = 'a3f8e61c0d92'
+branch_labels = None
+depends_on = None
+
+
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+# table -> [(column, referred table)]
+FOREIGN_KEYS = {
+    'show': [('artist_id', 'Artist'), ('venue_id', 'Venue')],
+    'venue_genre': [('venue_id', 'Venue')],
+    'artist_genre': [('artist_id', 'Artist')],
+}
+
+
+def recreate_foreign_keys(ondelete):
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    for table, keys in FOREIGN_KEYS.items():
+        with op.batch_alter_table(table, schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+            for column, referred in keys:
+                if sqlite:
+                    name = 'fk_{}_{}_{}'.format(table, column, referred)
+                else:
+                    name = '{}_{}_fkey'.format(table, column)
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    recreate_foreign_keys('CASCADE')
+
+
+def downgrade():
+    recreate_foreign_keys(None)
@@ -1,19 +1,103 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Identity, PrimaryKeyConstraint
-from forms import *
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Identity, PrimaryKeyConstraint, event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+import enums
 #----------------------------------------------------------------------------#
 # db SQLAlchemy Config.
 #----------------------------------------------------------------------------#
 db = SQLAlchemy()
 
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite only enforces foreign keys, ON DELETE CASCADE included, when
+    # asked to on each connection.
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
 #----------------------------------------------------------------------------#
 # Models.
 
+# Length of shows listed without one, and the longest a show may run.
+DEFAULT_SHOW_DURATION = timedelta(hours=2)
+MAX_SHOW_DURATION = timedelta(hours=24)
+
+def default_end_time(context):
+    return context.get_current_parameters()['start_time'] + DEFAULT_SHOW_DURATION
+
 class Show(db.Model):
     __tablename__ = 'show'
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), primary_key=True)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), primary_key=True)
-    start_time = db.Column(db.String(120), primary_key=True)
+    # Shows go with their venue or artist, deleted by the database.
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+    start_time = db.Column(db.DateTime(timezone=True), primary_key=True)
+    # A show occupies [start_time, end_time).
+    end_time = db.Column(db.DateTime(timezone=True), nullable=False, default=default_end_time)
+    # Bumped by every ORM update; the API's ETags are built from it.
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')
+    __mapper_args__ = {'version_id_col': version_id}
+    __table_args__ = (
+        # Sort key of the /shows keyset pagination.
+        db.Index('ix_show_start_time_venue_id_artist_id', 'start_time', 'venue_id', 'artist_id'),
+        # Past/upcoming range scans on the venue and artist pages.
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.CheckConstraint('end_time >= start_time', name='ck_show_end_time'),
+        # No double bookings of a venue or an artist (needs btree_gist).
+        # Elsewhere scheduling.py checks before inserting.
+        ExcludeConstraint(
+            ('venue_id', '='), (db.func.tstzrange(db.column('start_time'), db.column('end_time')), '&&'),
+            name='ex_show_venue_overlap', using='gist'
+        ).ddl_if(dialect='postgresql'),
+        ExcludeConstraint(
+            ('artist_id', '='), (db.func.tstzrange(db.column('start_time'), db.column('end_time')), '&&'),
+            name='ex_show_artist_overlap', using='gist'
+        ).ddl_if(dialect='postgresql'),
+    )
+#----------------------------------------------------------------------------#
+class Genre(db.Model):
+    __tablename__ = 'genre'
+    id = db.Column(db.Integer, primary_key=True)
+    # `name` is the enums.Genre member name used by the forms, `label` its display value.
+    name = db.Column(db.String(50), nullable=False, unique=True)
+    label = db.Column(db.String(50), nullable=False)
+
+@event.listens_for(Genre.__table__, 'after_create')
+def seed_genres(target, connection, **kw):
+    connection.execute(target.insert(), [
+        {'name': genre.name, 'label': genre.value} for genre in enums.Genre
+    ])
+
+class CounterState(db.Model):
+    # Single row. Show counters treat shows starting before `rolled_at` as
+    # past; `flask counters roll-forward` advances it (see counters.py).
+    __tablename__ = 'counter_state'
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+@event.listens_for(CounterState.__table__, 'after_create')
+def seed_counter_state(target, connection, **kw):
+    connection.execute(target.insert(), {'id': 1, 'rolled_at': datetime.now(timezone.utc)})
+
+# The (genre_id, venue_id|artist_id) indexes serve the genre filters and facets.
+venue_genre = db.Table(
+    'venue_genre',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+    db.Index('ix_venue_genre_genre_id_venue_id', 'genre_id', 'venue_id'),
+)
+
+artist_genre = db.Table(
+    'artist_genre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+    db.Index('ix_artist_genre_genre_id_artist_id', 'genre_id', 'artist_id'),
+)
 #----------------------------------------------------------------------------#
 class Venue(db.Model):
     __tablename__ = 'Venue'
@@ -24,13 +108,29 @@ class Venue(db.Model):
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=venue_genre, order_by=Genre.id, passive_deletes=True)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(300))
-    shows = db.relationship('Show', backref='Venue', lazy='joined', cascade="all, delete")
+    # Denormalized show counts, maintained by counters.py.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # passive_deletes: leave the shows to ON DELETE CASCADE instead of
+    # loading them to delete one by one (see deletes.py).
+    shows = db.relationship('Show', backref='Venue', lazy='select', cascade="all, delete", passive_deletes=True)
+    # Bumped by every ORM update, genre changes included; the API's ETags
+    # are built from it. The counters above change without bumping it.
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')
+    __mapper_args__ = {'version_id_col': version_id}
+    __table_args__ = (
+        # Name search (see search.py); PostgreSQL only.
+        db.Index('ix_venue_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('ix_venue_name_tsv', db.text("to_tsvector('simple', coalesce(name, ''))"),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 class Artist(db.Model):
@@ -41,15 +141,36 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=artist_genre, order_by=Genre.id, passive_deletes=True)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_description = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean(), default = True)
-    shows = db.relationship('Show', backref='Artist', lazy='joined', cascade="all, delete")
+    # Denormalized show counts, maintained by counters.py.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    shows = db.relationship('Show', backref='Artist', lazy='select', cascade="all, delete", passive_deletes=True)
+    # See Venue.version_id.
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')
+    __mapper_args__ = {'version_id_col': version_id}
+    __table_args__ = (
+        # Name search (see search.py); PostgreSQL only.
+        db.Index('ix_artist_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('ix_artist_name_tsv', db.text("to_tsvector('simple', coalesce(name, ''))"),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
+@event.listens_for(Session, 'before_flush')
+def bump_versions_for_genres(session, flush_context, instances):
+    # Genre changes only write the association tables, which would leave
+    # version_id as it was; setting it forces the UPDATE of the row.
+    for obj in session.dirty:
+        if isinstance(obj, (Venue, Artist)) and inspect(obj).attrs.genres.history.has_changes():
+            obj.version_id = inspect(obj).committed_state.get('version_id', obj.version_id) + 1
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 # app.app_context().push()
 # db.create_all()
\ No newline at end of file
@@ -0,0 +1,95 @@
+import threading
+import time
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError
+#----------------------------------------------------------------------------#
+# Connection pool telemetry.
+#
+# Counts checkouts, fresh connects, invalidations and pool timeouts from the
+# engine's pool events, and times how long requests wait for a connection.
+# Reported by /metrics next to the page cache stats.
+#----------------------------------------------------------------------------#
+
+class PoolMetrics:
+    def __init__(self, db=None, app=None):
+        self.checked_out = 0
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.engine = None
+        self._lock = threading.Lock()
+        if db is not None and app is not None:
+            self.init_app(db, app)
+
+    def init_app(self, db, app):
+        with app.app_context():
+            engine = db.engine
+        self.engine = engine
+        # Registered on the engine, the listeners carry over to the pool
+        # engine.dispose() puts in place of the current one.
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+        # Connections get their DBAPI connection from engine.raw_connection(),
+        # so timing it covers both queueing for a free slot and opening a
+        # new connection (the whole cost under NullPool), whichever pool the
+        # engine has. No pool event fires before the wait.
+        engine.raw_connection = self._timed(engine.raw_connection)
+        app.extensions['pool_metrics'] = self
+
+    def _timed(self, connect):
+        @wraps(connect)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return connect(*args, **kwargs)
+            except TimeoutError:
+                self._add(timeouts=1)
+                raise
+            finally:
+                waited = time.perf_counter() - started
+                with self._lock:
+                    self.wait_total += waited
+                    self.wait_max = max(self.wait_max, waited)
+        return wrapper
+
+    def _add(self, **counts):
+        with self._lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self._add(connects=1)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self._add(checkouts=1, checked_out=1)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        self._add(checked_out=-1)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self._add(invalidations=1)
+
+    def stats(self):
+        pool = self.engine.pool if self.engine is not None else None
+        with self._lock:
+            stats = {
+                'pool': type(pool).__name__ if pool is not None else None,
+                'checked_out': self.checked_out,
+                'checkouts': self.checkouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'timeouts': self.timeouts,
+                'wait_ms_total': round(self.wait_total * 1e3, 3),
+                'wait_ms_max': round(self.wait_max * 1e3, 3),
+                'wait_ms_avg': round(self.wait_total * 1e3 / self.checkouts, 3) if self.checkouts else None,
+            }
+        # QueuePool also knows its configured size and current overflow.
+        if hasattr(pool, 'overflow'):
+            stats.update(size=pool.size(), overflow=max(pool.overflow(), 0), idle=pool.checkedin())
+        return stats
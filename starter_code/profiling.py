@@ -0,0 +1,178 @@
+import heapq
+import json
+import logging
+import re
+import time
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from jinja2 import BaseLoader
+from sqlalchemy import event
+#----------------------------------------------------------------------------#
+# Per-request SQL profiling.
+#
+# When SQL_PROFILING is on, every request records its statement count, total
+# DB time, slowest statements, and the time spent loading templates (compiled,
+# or read from the bytecode cache, on first use in a process) apart from the
+# time spent rendering them. The numbers go out
+# as a Server-Timing header (visible in the browser's network panel), and
+# requests slower than SLOW_REQUEST_MS are logged as JSON lines.
+#
+# Config:
+#   SQL_PROFILING        enable the instrumentation (off by default)
+#   SLOW_REQUEST_MS      log requests taking longer than this
+#   SLOW_STATEMENTS      slowest statements kept per request
+#----------------------------------------------------------------------------#
+
+logger = logging.getLogger('fyyur.profile')
+
+# Quoted literals inlined into the SQL text; bound parameters are never logged.
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+WHITESPACE = re.compile(r'\s+')
+
+def redact(statement, limit=500):
+    statement = WHITESPACE.sub(' ', STRING_LITERAL.sub("'?'", statement)).strip()
+    return statement if len(statement) <= limit else statement[:limit] + '...'
+
+class RequestProfile:
+    def __init__(self, keep):
+        self.started = time.perf_counter()
+        self.keep = keep
+        self.statements = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.compile_time = 0.0
+        self.templates_compiled = 0
+        self.slowest = []
+        self._renders = []
+
+    def add_statement(self, statement, parameters, executemany, duration):
+        self.statements += 1
+        self.db_time += duration
+        entry = (duration, self.statements, statement, executemany, parameters)
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, entry)
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def as_dict(self):
+        total = time.perf_counter() - self.started
+        return {
+            'total_ms': round(total * 1e3, 2),
+            'db_ms': round(self.db_time * 1e3, 2),
+            'render_ms': round(self.render_time * 1e3, 2),
+            'compile_ms': round(self.compile_time * 1e3, 2),
+            'templates_compiled': self.templates_compiled,
+            'statements': self.statements,
+            'slowest': [{
+                'ms': round(duration * 1e3, 2),
+                'sql': redact(statement),
+                # Only the shape of the parameters, never their values.
+                'params': len(parameters) if parameters else 0,
+                'executemany': executemany,
+            } for duration, _, statement, executemany, parameters in sorted(self.slowest, reverse=True)],
+        }
+
+class RequestProfiler:
+    def __init__(self, db=None, app=None):
+        if db is not None and app is not None:
+            self.init_app(db, app)
+
+    def init_app(self, db, app):
+        self.slow_request = app.config.get('SLOW_REQUEST_MS', 500) / 1e3
+        self.keep = app.config.get('SLOW_STATEMENTS', 5)
+        app.extensions['profiler'] = self
+        if not app.config.get('SQL_PROFILING', False):
+            return
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.jinja_env.loader = TimedLoader(app.jinja_env.loader)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _start(self):
+        g.profile = RequestProfile(self.keep)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_started'].pop()
+        profile = g.get('profile') if has_request_context() else None
+        if profile is not None:
+            profile.add_statement(statement, parameters, executemany, duration)
+
+    def _before_render(self, app, template, context, **extra):
+        profile = g.get('profile')
+        if profile is not None:
+            profile._renders.append((time.perf_counter(), profile.compile_time))
+
+    def _after_render(self, app, template, context, **extra):
+        profile = g.get('profile')
+        if profile is not None and profile._renders:
+            started, compiled = profile._renders.pop()
+            # Only top-level renders count; nested ones are part of them.
+            # Templates they extend or include are loaded while rendering;
+            # that time counts as compiling.
+            if not profile._renders:
+                profile.render_time += time.perf_counter() - started - (profile.compile_time - compiled)
+
+    def _finish(self, response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        report = profile.as_dict()
+        response.headers.add('Server-Timing', 'db;dur={};desc="{} statements", compile;dur={};desc="{} templates", '
+                             'render;dur={}, total;dur={}'.format(
+            report['db_ms'], report['statements'], report['compile_ms'], report['templates_compiled'],
+            report['render_ms'], report['total_ms']))
+        if report['total_ms'] >= self.slow_request * 1e3:
+            logger.warning('slow request', extra={'request': {
+                'method': request.method, 'path': request.path, 'endpoint': request.endpoint,
+                'status': response.status_code,
+            }, 'profile': report})
+        return response
+
+class TimedLoader(BaseLoader):
+    """ Wraps the app's template loader to time each template load into the
+    current request's profile. Loads happen once per template and process
+    (or when a template changes, with auto-reload). """
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def get_source(self, environment, template):
+        return self.loader.get_source(environment, template)
+
+    def list_templates(self):
+        return self.loader.list_templates()
+
+    def load(self, environment, name, globals=None):
+        started = time.perf_counter()
+        try:
+            return self.loader.load(environment, name, globals)
+        finally:
+            profile = g.get('profile') if has_request_context() else None
+            if profile is not None:
+                profile.compile_time += time.perf_counter() - started
+                profile.templates_compiled += 1
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per line; `request` and `profile` extras included. """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'location': '{}:{}'.format(record.pathname, record.lineno),
+        }
+        for key in ('request', 'profile'):
+            if hasattr(record, key):
+                entry[key] = getattr(record, key)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
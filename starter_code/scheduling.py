@@ -0,0 +1,164 @@
+import random
+from sqlalchemy import or_, select
+from models import db, Venue, Artist, Show, MAX_SHOW_DURATION
+from counters import as_utc
+#----------------------------------------------------------------------------#
+# Double-booking checks.
+#
+# A show occupies [start_time, end_time), and neither its venue nor its
+# artist may have another show overlapping it. PostgreSQL enforces this with
+# the show exclusion constraints; the create form asks `find_conflict` first
+# to explain a refusal, and the importer checks whole files in memory with
+# `Bookings` instead of querying per row.
+#----------------------------------------------------------------------------#
+
+def find_conflict(venue_id, artist_id, start_time, end_time):
+    """ A show of the venue or the artist overlapping [start_time, end_time),
+    with both names, or None. """
+    return db.session.execute(
+        select(
+            Show.venue_id, Show.artist_id, Show.start_time, Show.end_time,
+            Venue.name.label('venue_name'), Artist.name.label('artist_name')
+        ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id).where(
+            or_(Show.venue_id == venue_id, Show.artist_id == artist_id),
+            Show.start_time < end_time,
+            Show.end_time > start_time,
+            # Empty ranges overlap nothing, as in the exclusion constraints.
+            Show.end_time > Show.start_time,
+            # Bounds the (venue_id|artist_id, start_time) index scans.
+            Show.start_time > start_time - MAX_SHOW_DURATION,
+        ).limit(1)
+    ).first()
+
+def conflict_message(conflict, venue_id):
+    if int(venue_id) == conflict.venue_id:
+        who = conflict.venue_name
+    else:
+        who = conflict.artist_name
+    return '{} is already booked from {:%Y-%m-%d %H:%M} to {:%Y-%m-%d %H:%M}.'.format(
+        who, conflict.start_time, conflict.end_time)
+
+# The constraints an insert violates when the show clashes with another
+# show, rather than naming a venue or artist that doesn't exist.
+BOOKING_CONSTRAINTS = ('ex_show_venue_overlap', 'ex_show_artist_overlap', 'show_pkey')
+
+def is_double_booking(error):
+    """ Whether an IntegrityError from inserting a show is a clash with
+    another show. """
+    diag = getattr(error.orig, 'diag', None)
+    if diag is not None:
+        return diag.constraint_name in BOOKING_CONSTRAINTS
+    # SQLite names no constraint; its unique violation is the primary key.
+    return str(error.orig).startswith('UNIQUE constraint failed')
+
+def seconds(value):
+    return int(as_utc(value).timestamp())
+
+class Interval:
+    """ Node of an interval tree: a treap ordered by start, each node also
+    holding the latest end in its subtree. """
+    __slots__ = ('start', 'end', 'other', 'priority', 'left', 'right', 'max_end')
+
+    def __init__(self, start, end, other):
+        self.start, self.end, self.other = start, end, other
+        self.priority = random.random()
+        self.left = self.right = None
+        self.max_end = end
+
+    def update(self):
+        self.max_end = max(self.end,
+                           self.left.max_end if self.left else self.end,
+                           self.right.max_end if self.right else self.end)
+
+def insert(node, interval):
+    """ Insert into the treap rooted at `node`; returns the new root.
+    Random priorities keep it balanced in expectation, whatever the order
+    of the inserts. """
+    if node is None:
+        return interval
+    if interval.start < node.start:
+        node.left = insert(node.left, interval)
+        if node.left.priority > node.priority:
+            node = rotate_right(node)
+    else:
+        node.right = insert(node.right, interval)
+        if node.right.priority > node.priority:
+            node = rotate_left(node)
+    node.update()
+    return node
+
+def rotate_right(node):
+    top = node.left
+    node.left, top.right = top.right, node
+    node.update()
+    top.update()
+    return top
+
+def rotate_left(node):
+    top = node.right
+    node.right, top.left = top.left, node
+    node.update()
+    top.update()
+    return top
+
+def overlapping(node, start, end):
+    """ The intervals under `node` overlapping [start, end). Subtrees ending
+    before `start` are skipped on their max_end, so stored intervals need
+    not be disjoint. """
+    if node is None or node.max_end <= start:
+        return
+    yield from overlapping(node.left, start, end)
+    if node.start < end:
+        if node.end > start:
+            yield node
+        yield from overlapping(node.right, start, end)
+
+class Bookings:
+    """ The shows of each venue and artist as [start, end) intervals in
+    epoch seconds, in one interval tree per venue and per artist. Inserts
+    cost O(log n) and a check O(log n) per overlapping show it finds, so
+    validating n shows is O(n log n). """
+
+    def __init__(self):
+        # ('venue' | 'artist', id) -> root Interval
+        self._trees = {}
+
+    @classmethod
+    def load(cls):
+        """ The shows already booked, streamed in start order. """
+        bookings = cls()
+        rows = db.session.execute(
+            select(Show.venue_id, Show.artist_id, Show.start_time, Show.end_time)
+            .order_by(Show.start_time).execution_options(yield_per=10000))
+        for venue_id, artist_id, start_time, end_time in rows:
+            bookings.add(venue_id, artist_id, start_time, end_time)
+        return bookings
+
+    def book(self, venue_id, artist_id, start_time, end_time):
+        """ Add the show unless it overlaps another show of its venue or
+        artist; returns 'venue' or 'artist' when it does, else None. Booking
+        the same show again (same venue, artist and start) is not a
+        conflict. """
+        start, end = seconds(start_time), seconds(end_time)
+        conflict = None
+        for key, other in self._keys(venue_id, artist_id):
+            for interval in overlapping(self._trees.get(key), start, end):
+                if interval.start == start and interval.other == other:
+                    return None
+                conflict = conflict or key[0]
+        if conflict is None and end > start:
+            self._insert(venue_id, artist_id, start, end)
+        return conflict
+
+    def add(self, venue_id, artist_id, start_time, end_time):
+        """ Add a booked show without checking it. """
+        start, end = seconds(start_time), seconds(end_time)
+        if end > start:
+            self._insert(venue_id, artist_id, start, end)
+
+    def _keys(self, venue_id, artist_id):
+        return ((('venue', venue_id), artist_id), (('artist', artist_id), venue_id))
+
+    def _insert(self, venue_id, artist_id, start, end):
+        for key, other in self._keys(venue_id, artist_id):
+            self._trees[key] = insert(self._trees.get(key), Interval(start, end, other))
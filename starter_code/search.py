@@ -0,0 +1,167 @@
+from collections import defaultdict
+import re
+from flask import current_app
+from sqlalchemy import event, select
+from flask_sqlalchemy.session import Session
+from models import db, Venue, Artist, Show
+#----------------------------------------------------------------------------#
+# Venue/Artist name search.
+#
+# Backends (config SEARCH_BACKEND):
+#   'trigram'  -- ILIKE '%term%' served by a pg_trgm GIN index, ranked by
+#                 similarity().
+#   'fulltext' -- prefix tsquery against a to_tsvector('simple', name) GIN
+#                 index, ranked by ts_rank().
+#   'memory'   -- pure-Python trigram index, used automatically when the
+#                 database is not PostgreSQL (e.g. SQLite test runs).
+#----------------------------------------------------------------------------#
+
+SHOW_FK = {Venue: Show.venue_id, Artist: Show.artist_id}
+
+def search(model, term, limit=None):
+    """ Return up to `limit` rows of (id, name, num_upcoming_shows) whose name
+    contains `term`, best matches first. """
+    query, ids = search_query(model, term, limit)
+    if query is None:
+        return []
+    return in_order(db.session.execute(query).all(), ids)
+
+def search_query(model, term, limit=None):
+    """ The search statement, or None when nothing can match. For the memory
+    backend also the ranked ids, to reorder the rows with `in_order`. """
+    limit = limit or current_app.config.get('SEARCH_LIMIT', 50)
+    backend = current_app.config.get('SEARCH_BACKEND', 'trigram')
+    if db.engine.dialect.name != 'postgresql':
+        backend = 'memory'
+
+    term = term.strip()
+    query = select(model.id, model.name, model.upcoming_shows_count.label('num_upcoming_shows'))
+    if backend == 'memory':
+        ids = get_index(model).search(term, limit)
+        if not ids:
+            return None, None
+        return query.where(model.id.in_(ids)), ids
+    if backend == 'fulltext':
+        tsquery = to_prefix_tsquery(term)
+        if not tsquery:
+            return None, None
+        # Spelled out literally so the planner matches the expression index.
+        simple = db.literal_column("'simple'")
+        vector = db.func.to_tsvector(simple, db.func.coalesce(model.name, db.literal_column("''")))
+        tsquery = db.func.to_tsquery(simple, tsquery)
+        query = query.where(vector.bool_op('@@')(tsquery)).order_by(
+            db.func.ts_rank(vector, tsquery).desc(), model.name)
+    else:
+        query = query.where(model.name.ilike('%' + escape_like(term) + '%', escape='\\')).order_by(
+            db.func.similarity(model.name, term).desc(), model.name)
+    return query.limit(limit), None
+
+def in_order(rows, ids):
+    if ids is None:
+        return rows
+    rows = {row.id: row for row in rows}
+    return [rows[id] for id in ids if id in rows]
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def to_prefix_tsquery(term):
+    # "musical ho" -> "musical:* & ho:*"
+    words = re.findall(r'\w+', term.lower())
+    return ' & '.join(word + ':*' for word in words)
+
+#----------------------------------------------------------------------------#
+# In-memory fallback index.
+#----------------------------------------------------------------------------#
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class MemoryIndex:
+    """ Case-insensitive substring index over names, using trigram postings
+    to narrow the candidates before the substring check. """
+
+    def __init__(self, rows=()):
+        self._names = {}
+        self._postings = defaultdict(set)
+        for id, name in rows:
+            self.add(id, name)
+
+    def add(self, id, name):
+        self.remove(id)
+        name = name or ''
+        self._names[id] = name
+        for gram in trigrams(name.casefold()):
+            self._postings[gram].add(id)
+
+    def remove(self, id):
+        name = self._names.pop(id, None)
+        if name is None:
+            return
+        for gram in trigrams(name.casefold()):
+            ids = self._postings[gram]
+            ids.discard(id)
+            if not ids:
+                del self._postings[gram]
+
+    def search(self, term, limit):
+        term = term.casefold()
+        grams = trigrams(term)
+        if grams:
+            candidates = set.intersection(*(self._postings.get(gram, set()) for gram in grams))
+        else:
+            candidates = self._names.keys()
+        matches = []
+        for id in candidates:
+            name = self._names[id].casefold()
+            position = name.find(term)
+            if position >= 0:
+                # Exact match, then prefix match, then earliest/shortest match.
+                matches.append((name != term, position, len(name), name, id))
+        matches.sort()
+        return [match[-1] for match in matches[:limit]]
+
+_indexes = {}
+
+def get_index(model):
+    index = _indexes.get(model)
+    if index is None:
+        index = _indexes[model] = MemoryIndex(db.session.execute(select(model.id, model.name)).all())
+    return index
+
+def invalidate(model):
+    """ Drop the index after bulk writes; it is rebuilt on the next search. """
+    _indexes.pop(model, None)
+
+def forget(model, ids):
+    """ Drop ids removed behind the ORM's back (bulk deletes). """
+    index = _indexes.get(model)
+    if index is not None:
+        for id in ids:
+            index.remove(id)
+
+# Keep built indexes in step with committed ORM changes.
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    changes = session.info.setdefault('search_changes', [])
+    for obj in session.new | session.dirty:
+        if type(obj) in SHOW_FK:
+            changes.append((type(obj), obj.id, obj.name or ''))
+    for obj in session.deleted:
+        if type(obj) in SHOW_FK:
+            changes.append((type(obj), obj.id, None))
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    for model, id, name in session.info.pop('search_changes', []):
+        index = _indexes.get(model)
+        if index is None:
+            continue
+        if name is None:
+            index.remove(id)
+        else:
+            index.add(id, name)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('search_changes', None)
@@ -2,3 +2,41 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Typeahead for ID fields: <input list="..." data-autocomplete="venue|artist"
+// data-autocomplete-id="venue_id"> suggests names from /api/autocomplete
+// and copies the ID of the chosen one into the ID field.
+document.querySelectorAll('[data-autocomplete]').forEach(function (input) {
+  var list = document.getElementById(input.getAttribute('list'));
+  var idField = document.getElementById(input.dataset.autocompleteId);
+  var ids = {};
+  var timer, pending;
+  input.addEventListener('input', function () {
+    if (ids.hasOwnProperty(input.value)) {
+      idField.value = ids[input.value];
+      return;
+    }
+    clearTimeout(timer);
+    timer = setTimeout(function () {
+      var q = input.value.trim();
+      if (!q) return;
+      if (pending) pending.abort();
+      pending = new AbortController();
+      fetch('/api/autocomplete?type=' + input.dataset.autocomplete + '&q=' + encodeURIComponent(q),
+            {signal: pending.signal})
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          ids = {};
+          list.innerHTML = '';
+          data.results.forEach(function (result) {
+            // The ID keeps options with the same name apart.
+            var option = document.createElement('option');
+            option.value = result.name + ' (#' + result.id + ')';
+            ids[option.value] = result.id;
+            list.appendChild(option);
+          });
+        })
+        .catch(function () {});
+    }, 100);
+  });
+});
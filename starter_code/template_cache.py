@@ -0,0 +1,77 @@
+import os
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from jinja2 import FileSystemBytecodeCache
+#----------------------------------------------------------------------------#
+# Compiled template cache.
+#
+# Jinja compiles every template to Python code the first time a process uses
+# it. With TEMPLATE_CACHE_DIR set, the compiled code is also written there
+# and other processes load it instead of compiling again. Fill it at build
+# time so new workers start warm:
+#
+#   flask --app app precompile-templates
+#
+# The app never creates the directory, and compiled code it can't write
+# (no directory yet, read-only filesystem) is just not cached.
+#
+# Config:
+#   TEMPLATE_CACHE_DIR    directory of the compiled templates, relative to
+#                         the instance folder; empty disables
+#----------------------------------------------------------------------------#
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """ Keyed on template paths relative to the app root, so a cache filled
+    at build time holds wherever the app is deployed, and apart for async
+    environments, which compile the same source to different code. """
+
+    def __init__(self, directory, root):
+        super().__init__(directory)
+        self.root = root
+
+    def get_bucket(self, environment, name, filename, source):
+        if filename is not None:
+            filename = os.path.relpath(filename, self.root)
+        if environment.is_async:
+            name = 'async:' + name
+        return super().get_bucket(environment, name, filename, source)
+
+    def dump_bytecode(self, bucket):
+        try:
+            super().dump_bytecode(bucket)
+        except OSError:
+            pass
+
+def cache_dir(app):
+    directory = app.config.get('TEMPLATE_CACHE_DIR')
+    return os.path.join(app.instance_path, directory) if directory else None
+
+def init_app(app):
+    directory = cache_dir(app)
+    if directory:
+        app.jinja_env.bytecode_cache = TemplateBytecodeCache(directory, app.root_path)
+    app.cli.add_command(precompile_command)
+
+def template_names(env):
+    return [name for name in env.list_templates() if name.endswith('.html')]
+
+@click.command('precompile-templates')
+@with_appcontext
+def precompile_command():
+    """ Compile every template into TEMPLATE_CACHE_DIR. """
+    directory = cache_dir(current_app)
+    if not directory:
+        raise click.UsageError('TEMPLATE_CACHE_DIR is not set.')
+    os.makedirs(directory, exist_ok=True)
+    envs = [current_app.jinja_env]
+    if current_app.config['ASYNC_PAGES']:
+        envs.append(current_app.jinja_env.overlay(enable_async=True))
+    started = time.perf_counter()
+    names = template_names(current_app.jinja_env)
+    for env in envs:
+        for name in names:
+            env.get_template(name)
+    click.echo('Compiled {} templates into {} in {:.0f} ms.'.format(
+        len(names) * len(envs), directory, (time.perf_counter() - started) * 1e3))